@@ -22,4 +22,4 @@
 04 703
 05 201
 06 806
-07 90
+07 900
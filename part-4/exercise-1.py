@@ -55,6 +55,7 @@ def main(cpu=None, iterations=1):
 
     # Run the program
     cpu.debug = True
+    cpu.trace_mode = 'delta'
     program_iterations(cpu, iterations)
 
 
@@ -0,0 +1,208 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+""" Tiny-P Exercise Harness.
+Tiny-P is a simple CPU Simulator intended as a teaching aid for students
+learning about computer architecture.
+This program is free software: you can redistribute it and/or modify it under
+the terms of the GNU General Public License as published by the Free Software
+Foundation, either version 2 of the License, or (at your option) any later
+version.
+This program is distributed in the hope that it will be useful, but WITHOUT
+ANY WARRANTY; without even the implied warranty of MERCHANTABILITY or FITNESS
+FOR A PARTICULAR PURPOSE. See the GNU General Public License for more details.
+You should have received a copy of the GNU General Public License along with
+this program. If not, see <http://www.gnu.org/licenses/>.
+"""
+
+__author__ = "Randall Morgan"
+__contact__ = "rmorgan@coderancher.us"
+__copyright__ = "Copyright 2022, SensorNet"
+__credits__ = ["Randall Morgan", "SensorNet.Us"]
+__date__ = "2022/05/23"
+__deprecated__ = False
+__email__ =  "rmorgan@coderancher.us"
+__license__ = "GPLv2 or Later"
+__maintainer__ = "Randall Morgan"
+__status__ = "Production"
+__version__ = "1.0.0"
+
+# Tiny-P Exercise Harness
+# Runs the exercise programs listed in a JSON manifest
+# (exercises.json) and checks their results:
+#
+#   {
+#       "name": "exercise-0",
+#       "program": "exercise-0.asm",
+#       "memory": {"0": 9, "1": 6},      # RAM set before the run
+#       "budget": 3,                     # Most instructions to run
+#       "expect": {"acc": 3, "memory": {"3": 3}}
+#   }
+#
+# The machine code is read from the .bin file next to the .asm
+# file when there is one (see the part-5 assembler), otherwise
+# from the "<address> <opcode>" translation at the end of the
+# .asm file. Tiny-P has no halt instruction, so a program runs
+# until its budget is spent, or until it parks on a branch to
+# itself (such as BRZ 4 at address 4).
+#
+# Usage: harness.py [-t] [-j] [-r <repeat>] [-m <manifest>] [name ...]
+#   -t  run on the teaching CPU rather than FastCPU
+#   -j  print the results as JSON
+#   -r  run each exercise <repeat> times and report the fastest
+
+import getopt
+import json
+import os
+import sys
+import time
+
+from cpu import CPU, FastCPU
+
+MANIFEST = 'exercises.json'
+BRANCHES = (8, 9)
+
+
+def read_program(path: str) -> list:
+    # (address, opcode) pairs from a .bin file, or from the machine
+    # code lines of a .asm file: lines of exactly two numbers
+    binary = os.path.splitext(path)[0] + '.bin'
+    if path.endswith('.asm') and os.path.exists(binary):
+        path = binary
+    with open(path, 'r') as ifh:
+        lines = ifh.read().split('\n')
+
+    program = []
+    for line in lines:
+        fields = line.split('#')[0].split()
+        if len(fields) == 2 and all(field.isdigit() for field in fields):
+            program.append((int(fields[0]), int(fields[1])))
+    if not program:
+        raise ValueError(f'No machine code found in {path}')
+    return program
+
+
+class Exercise:
+    def __init__(self, spec: dict, directory: str = '.'):
+        self.name = spec['name']
+        self.path = os.path.join(directory, spec['program'])
+        self.memory = {int(address): value for address, value in spec.get('memory', {}).items()}
+        self.budget = spec['budget']
+        expect = spec.get('expect', {})
+        self.expect_acc = expect.get('acc')
+        self.expect_memory = {int(address): value for address, value in expect.get('memory', {}).items()}
+        self.program = read_program(self.path)
+
+    def load(self, cpu: CPU):
+        cpu.init_rom()
+        cpu.reset()
+        for address, value in self.memory.items():
+            cpu.mem[address] = value
+        for address, opcode in self.program:
+            cpu.program(address, opcode)
+
+    def run(self, cpu: CPU) -> tuple[int, bool]:
+        # Returns the instructions executed and whether the
+        # program parked before its budget was spent
+        step = cpu.step
+        executed = 0
+        while executed < self.budget:
+            address = cpu.pc
+            step()
+            executed += 1
+            if cpu.pc == address and cpu.opcode in BRANCHES:
+                return executed, True
+        return executed, False
+
+    def check(self, cpu: CPU) -> list[str]:
+        failures = []
+        if self.expect_acc is not None and cpu.acc != self.expect_acc:
+            failures.append(f'ACC expected {self.expect_acc} got {cpu.acc}')
+        for address, value in sorted(self.expect_memory.items()):
+            if cpu.mem[address] != value:
+                failures.append(f'MEM[{address}] expected {value} got {cpu.mem[address]}')
+        return failures
+
+
+def run_exercise(exercise: Exercise, cpu_class=FastCPU, repeat: int = 1) -> dict:
+    best = None
+    for _ in range(repeat):
+        cpu = cpu_class()
+        exercise.load(cpu)
+        start = time.perf_counter()
+        executed, parked = exercise.run(cpu)
+        seconds = time.perf_counter() - start
+        best = seconds if best is None else min(best, seconds)
+
+    failures = exercise.check(cpu)
+    return {
+        'name': exercise.name,
+        'passed': not failures,
+        'failures': failures,
+        'instructions': executed,
+        'parked': parked,
+        'seconds': best,
+        'instructions_per_second': executed / best if best else 0.0,
+    }
+
+
+def load_manifest(path: str) -> list[Exercise]:
+    with open(path, 'r') as ifh:
+        specs = json.load(ifh)
+    directory = os.path.dirname(os.path.abspath(path))
+    return [Exercise(spec, directory) for spec in specs]
+
+
+def report(result: dict) -> str:
+    status = 'PASS' if result['passed'] else 'FAIL'
+    ending = 'parked' if result['parked'] else 'budget'
+    line = (f"{status} {result['name']}: {result['instructions']} instructions ({ending}) "
+            f"in {result['seconds'] * 1e6:.1f} us")
+    for failure in result['failures']:
+        line += f'\n    {failure}'
+    return line
+
+
+def main(argv):
+    manifest = os.path.join(os.path.dirname(os.path.abspath(__file__)), MANIFEST)
+    cpu_class = FastCPU
+    as_json = False
+    repeat = 1
+    usage_message = "Usage: harness.py [-t] [-j] [-r <repeat>] [-m <manifest>] [name ...]"
+
+    try:
+        opts, args = getopt.getopt(argv, "htjr:m:", ["help", "teaching", "json", "repeat=", "manifest="])
+    except getopt.GetoptError:
+        print(usage_message)
+        sys.exit(2)
+    for opt, arg in opts:
+        if opt in ('-h', '--help'):
+            print(usage_message)
+            sys.exit()
+        elif opt in ('-t', '--teaching'):
+            cpu_class = CPU
+        elif opt in ('-j', '--json'):
+            as_json = True
+        elif opt in ('-r', '--repeat'):
+            repeat = max(1, int(arg))
+        elif opt in ('-m', '--manifest'):
+            manifest = arg
+
+    exercises = load_manifest(manifest)
+    if args:
+        exercises = [exercise for exercise in exercises if exercise.name in args]
+
+    results = [run_exercise(exercise, cpu_class, repeat) for exercise in exercises]
+    if as_json:
+        print(json.dumps(results, indent=1))
+    else:
+        for result in results:
+            print(report(result))
+        passed = sum(result['passed'] for result in results)
+        print(f'{passed} of {len(results)} exercises passed')
+
+    if not all(result['passed'] for result in results):
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main(sys.argv[1:])
@@ -28,6 +28,8 @@ __version__ = "1.0.0"
 
 import sys, getopt
 
+from tokenizer import COMMENT, DIRECTIVE, IDENTIFIER, LABEL, MNEMONIC, NUMBER, Tokenizer, number_value
+
 # The Opcode table relates mnemonics
 # to the corresponding opcode value.
 OPCODE_TABLE = {
@@ -47,19 +49,23 @@ MNEMONICS = ['nop', 'lda', 'sta', 'and', 'or', 'not', 'add', 'sub', 'brz', 'brp'
 
 
 class Lexer:
-    def __init__(self):
+    def __init__(self, mnemonics=MNEMONICS):
+        self.tokenizer = Tokenizer(mnemonics)
         self.line = None
         self.tokens = []
+        self.position = 0
 
     def set_text(self, line: str):
         self.line = line
-        self.tokens = line.split()
+        self.tokens = self.tokenizer.tokens(line)
+        self.position = 0
 
     def next_token(self):
-        if not self.tokens:
+        if self.position >= len(self.tokens):
             return None
 
-        tok = self.tokens.pop(0)
+        tok = self.tokens[self.position]
+        self.position += 1
         return tok
 
 
@@ -74,15 +80,6 @@ class Assembler:
         self.symbol_table = {}
         self.code = []
 
-    def skip_spaces(self, tok: str):
-        while tok.isspace():
-            tok = self.lexer.next_token()
-
-    def skip_comment(self, tok: str):
-        if tok == '#':
-            while tok:
-                tok = self.lexer.next_token()
-
     def fixup(self):
         text_ = ''
         for line in self.code:
@@ -108,7 +105,6 @@ class Assembler:
 
     def parse(self):
         for line in self.lines:
-            line = line.lower()
             self.opcode = 0
             self.operand = 0
 
@@ -116,47 +112,46 @@ class Assembler:
 
             tok = self.lexer.next_token()
             while tok is not None:
-                self.skip_spaces(tok)
-
-                if tok is None or not tok:
+                if tok.kind == COMMENT:
+                    # COMMENT
                     break
 
-                elif tok.endswith(':'):
+                elif tok.kind == LABEL:
                     # LABEL_DECL
-                    key = tok[:-1]
+                    key = tok.text[:-1]
                     self.symbol_table[key] = self.current_address
 
-                elif tok == '#':
-                    # COMMENT
-                    self.skip_comment(tok)
-                    break
-
-                elif tok.endswith('.'):
+                elif tok.kind == DIRECTIVE:
                     # DIRECTIVE
-                    if tok[:-1] == 'org':
+                    if tok.text[:-1] == 'org':
                         operand = self.lexer.next_token()
-                        if operand.isnumeric():
-                            self.current_address = int(operand)
+                        if operand is not None and operand.kind == NUMBER:
+                            self.current_address = number_value(operand.text)
                         else:
-                            raise ValueError('Illegal Origin. Expected: integer, Found {operand}')
+                            found = operand.text if operand else None
+                            raise ValueError(f'Illegal Origin. Expected: integer, Found {found}')
                     break
-                elif tok in MNEMONICS:
+                elif tok.kind == MNEMONIC:
                     # INSTRUCTION
-                    self.opcode = OPCODE_TABLE[tok]
+                    self.opcode = OPCODE_TABLE[tok.text]
                     operand = self.lexer.next_token()
-                    if operand.isnumeric():
-                        self.operand = operand
-                    elif operand.isalnum():
-                        if operand in self.symbol_table:
-                            self.operand = self.symbol_table[operand]
-                        else:
-                            self.operand = operand
-                    elif operand.startswith('#'):
+                    if operand is None or operand.kind == COMMENT:
+                        # NOT takes no operand
                         self.operand = 0
-                        self.skip_comment(operand)
+                    elif operand.kind == NUMBER:
+                        self.operand = number_value(operand.text)
+                    elif operand.kind in (IDENTIFIER, MNEMONIC):
+                        if operand.text in self.symbol_table:
+                            self.operand = self.symbol_table[operand.text]
+                        else:
+                            self.operand = operand.text
+                    else:
+                        raise ValueError(f'Illegal Operand: {operand.text}')
 
                     self.code.append(f"{self.current_address} : {self.opcode}-{self.operand}")
                     self.current_address += 1
+                    if operand is None or operand.kind == COMMENT:
+                        break
 
                 tok = self.lexer.next_token()
 
@@ -26,6 +26,37 @@ __maintainer__ = "Randall Morgan"
 __status__ = "Production"
 __version__ = "1.0.0"
 
+import atexit
+import sys
+import time
+
+# Throttled run: supported clock rates, the length of a burst of
+# instructions between sleeps, and how far behind the clock may
+# fall (after a pause in a debugger, say) before it is reset
+# rather than caught up with a fast burst.
+MIN_FREQUENCY = 1
+MAX_FREQUENCY = 100_000
+BURST_TIME = 0.01
+MAX_LAG = 0.25
+
+# Delta trace: mnemonics by opcode, and lines buffered before they
+# are written to a trace_stream
+MNEMONICS = ['NOP', 'LDA', 'STA', 'AND', 'OR', 'NOT', 'ADD', 'SUB', 'BRZ', 'BRP']
+TRACE_BUFFER_LINES = 256
+
+# CPUs with buffered trace lines. Tiny-P has no halt instruction,
+# so most runs just stop; whatever is left is written at exit.
+PENDING_TRACES = set()
+
+
+def flush_pending_traces():
+    for cpu in list(PENDING_TRACES):
+        cpu.flush_trace()
+
+
+atexit.register(flush_pending_traces)
+
+
 class CPU:
     def __init__(self):
         self.MAX_MEM = 100
@@ -38,12 +69,72 @@ class CPU:
         self.prog = []
         self.mem = []
         self.halted = False
+        # Clock rates of the last run_throttled(), 0.0 before one
+        self.target_frequency = 0.0
+        self.achieved_frequency = 0.0
         self.debug = False
+        # With debug set, 'full' prints all of ROM and RAM after
+        # every instruction. 'delta' prints the instruction and what
+        # it changed, and dumps ROM and RAM only at halt or dump().
+        # Delta lines go straight to stdout, in order with print(),
+        # or are buffered when trace_stream is set to a file.
+        self.trace_mode = 'full'
+        self.trace_stream = None
+        self.trace_lines = []
+        self.last_trace = (self.pc, self.acc, self.zero_flag, self.pos_flag)
 
     def run(self, steps=None):
         while not self.halted:
             self.step()
 
+    def run_throttled(self, frequency=None, steps=None) -> dict:
+        """ Run at a steady clock rate until halted, or until steps
+        instructions have run. The default rate is one instruction
+        per cycle_time_in_ms.
+        Instructions run in bursts of about BURST_TIME seconds, then
+        the CPU sleeps until the time the burst should end at the
+        target rate. Deadlines are measured from the start of the
+        run, so sleep errors do not add up to drift. Returns the
+        target and achieved frequency in Hz.
+        """
+        if frequency is None:
+            frequency = 1000 / self.cycle_time_in_ms
+        if not MIN_FREQUENCY <= frequency <= MAX_FREQUENCY:
+            raise ValueError(f"Clock rate out of range {MIN_FREQUENCY} - {MAX_FREQUENCY} Hz: {frequency}")
+        burst = max(1, int(frequency * BURST_TIME))
+        period = 1 / frequency
+        self.target_frequency = frequency
+        self.achieved_frequency = 0.0
+
+        step = self.step
+        executed = 0
+        start = clock = time.perf_counter()
+        while not self.halted and (steps is None or executed < steps):
+            count = burst if steps is None else min(burst, steps - executed)
+            for _ in range(count):
+                step()
+                executed += 1
+                if self.halted:
+                    break
+            now = time.perf_counter()
+            delay = clock + executed * period - now
+            if delay > 0:
+                time.sleep(delay)
+            elif delay < -MAX_LAG:
+                # Too far behind to catch up, so restart the clock
+                clock = now - executed * period
+            self.achieved_frequency = executed / (time.perf_counter() - start)
+
+        result = {
+            'target_hz': frequency,
+            'achieved_hz': self.achieved_frequency,
+            'instructions': executed,
+            'seconds': time.perf_counter() - start,
+        }
+        if self.trace_lines:
+            self.flush_trace()
+        return result
+
     def step(self):
         self.fetch()
         self.decode()
@@ -52,20 +143,69 @@ class CPU:
 
     def halt(self):
         self.halted = True
+        if self.debug and self.trace_mode == 'delta':
+            self.dump()
 
     def trace(self):
+        if self.trace_mode == 'delta':
+            self.trace_delta()
+            return
         # Display CPU and Memory
         print(f'Opcode: {self.opcode}, Operand: {self.operand}')
         print(f"ACC: {self.acc}, PC: {self.pc}, Z: {self.zero_flag}, P: {self.pos_flag}")
         print(f"ROM: {self.prog}")
         print(f"MEM: {self.mem}")
 
+    def trace_delta(self):
+        # One line per instruction: its address, the word and its
+        # mnemonic, then the registers and memory cell it changed.
+        pc, acc, zero_flag, pos_flag = self.last_trace
+        line = f'{pc:02d}: {self.instr:03d} {MNEMONICS[self.opcode]} {self.operand:02d}'
+        if self.acc != acc:
+            line += f' ACC={self.acc}'
+        if self.zero_flag != zero_flag:
+            line += f' Z={self.zero_flag}'
+        if self.pos_flag != pos_flag:
+            line += f' P={self.pos_flag}'
+        if self.pc != (pc + 1) % self.MAX_MEM:
+            line += f' PC={self.pc}'
+        if self.opcode == 2:
+            line += f' MEM[{self.operand}]={self.mem[self.operand]}'
+        self.last_trace = (self.pc, self.acc, self.zero_flag, self.pos_flag)
+        if self.trace_stream is None:
+            # stdout buffers the line itself, and print() writes
+            # through the same buffer
+            sys.stdout.write(line + '\n')
+            return
+        self.trace_lines.append(line + '\n')
+        PENDING_TRACES.add(self)
+        if len(self.trace_lines) >= TRACE_BUFFER_LINES:
+            self.flush_trace()
+
+    def dump(self):
+        # Full register, ROM and RAM dump to the trace stream
+        self.trace_lines.append(f"ACC: {self.acc}, PC: {self.pc}, Z: {self.zero_flag}, P: {self.pos_flag}\n")
+        self.trace_lines.append(f"ROM: {self.prog}\n")
+        self.trace_lines.append(f"MEM: {self.mem}\n")
+        self.flush_trace()
+
+    def flush_trace(self):
+        # Write buffered trace lines. Runs at the end of
+        # run_throttled(), at halt and at exit.
+        PENDING_TRACES.discard(self)
+        stream = self.trace_stream or sys.stdout
+        if self.trace_lines:
+            stream.write(''.join(self.trace_lines))
+            self.trace_lines = []
+        stream.flush()
+
     def cold_start(self):
         self.init_rom()
 
     def reset(self):
         self.acc = self.pc = self.instr = 0
         self.zero_flag = self.pos_flag = True
+        self.last_trace = (self.pc, self.acc, self.zero_flag, self.pos_flag)
         self.init_memory()
 
     def update_acc(self, value):
@@ -261,6 +401,120 @@ class CPU:
             self.update_pc(self.operand)
 
 
+class FastCPU(CPU):
+    # The same machine as CPU, decoded with divmod() into a table of
+    # handlers indexed by opcode. Instructions are checked when they
+    # are programmed into ROM and when run() starts. step() checks
+    # only the instruction range, for ROM written directly through
+    # prog, and the handlers do no checks.
+    def __init__(self):
+        super().__init__()
+        self.opcode = 0
+        self.operand = 0
+        self.handlers = [
+            self.__impl_nop,
+            self.__impl_load,
+            self.__impl_store,
+            self.__impl_and,
+            self.__impl_or,
+            self.__impl_not,
+            self.__impl_add,
+            self.__impl_sub,
+            self.__impl_branch_zero,
+            self.__impl_branch_positive,
+        ]
+
+    @staticmethod
+    def test_instruction(value):
+        if not 0 <= value < 1000:
+            raise ValueError(f"Illegal Instruction, expected: 0 - 999 Got: {value}")
+
+    def program(self, address, value):
+        self.test_instruction(value)
+        self.prog[address] = value
+
+    def validate(self):
+        # Check every ROM location holds a legal instruction
+        for value in self.prog:
+            self.test_instruction(value)
+
+    def run(self, steps=None):
+        self.validate()
+        step = self.step
+        while not self.halted:
+            step()
+
+    def run_throttled(self, frequency=None, steps=None) -> dict:
+        self.validate()
+        return super().run_throttled(frequency, steps)
+
+    def step(self):
+        # Fetch
+        self.instr = self.prog[self.pc]
+        self.pc += 1
+        if self.pc >= self.MAX_MEM:
+            self.pc = 0
+
+        # Decode and execute
+        if not 0 <= self.instr < 1000:
+            raise ValueError("Undefined Opcode")
+        self.opcode, self.operand = divmod(self.instr, 100)
+        self.handlers[self.opcode](self.operand)
+        if self.debug:
+            self.trace()
+
+    def decode(self):
+        if not 0 <= self.instr < 1000:
+            raise ValueError("Undefined Opcode")
+        self.opcode, self.operand = divmod(self.instr, 100)
+        self.handlers[self.opcode](self.operand)
+
+    # Instruction execution methods. Flags are set as update_acc() does.
+    def __impl_nop(self, operand):
+        pass
+
+    def __impl_load(self, operand):
+        acc = self.acc = self.mem[operand]
+        self.zero_flag = acc == 0
+        self.pos_flag = acc >= 0
+
+    def __impl_store(self, operand):
+        self.mem[operand] = self.acc
+
+    def __impl_and(self, operand):
+        acc = self.acc = self.acc & self.mem[operand]
+        self.zero_flag = acc == 0
+        self.pos_flag = acc >= 0
+
+    def __impl_or(self, operand):
+        acc = self.acc = self.acc | self.mem[operand]
+        self.zero_flag = acc == 0
+        self.pos_flag = acc >= 0
+
+    def __impl_not(self, operand):
+        acc = self.acc = ~self.acc
+        self.zero_flag = acc == 0
+        self.pos_flag = acc >= 0
+
+    def __impl_add(self, operand):
+        acc = self.acc = self.acc + self.mem[operand]
+        self.zero_flag = acc == 0
+        self.pos_flag = acc >= 0
+
+    def __impl_sub(self, operand):
+        acc = self.acc = self.acc - self.mem[operand]
+        self.zero_flag = acc == 0
+        self.pos_flag = acc >= 0
+
+    def __impl_branch_zero(self, operand):
+        if self.zero_flag:
+            self.pc = operand
+
+    def __impl_branch_positive(self, operand):
+        if self.pos_flag:
+            self.pc = operand
+
+
 def main():
     cpu = CPU()     # Create the CPU object
 
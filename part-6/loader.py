@@ -36,7 +36,7 @@ __version__ = "1.0.0"
 
 import sys, getopt
 
-from cpu import CPU
+from cpu import CPU, FastCPU
 
 
 class Loader:
@@ -83,7 +83,7 @@ def main(argv):
     ifh.close()
 
     # Loader program
-    cpu = CPU()
+    cpu = FastCPU()
     loader = Loader(cpu, program_text)
     loader.cpu_init()
     loader.load()
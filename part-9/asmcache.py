@@ -0,0 +1,161 @@
+#!/usr/bin/python3
+# -*- coding: utf-8 -*-
+# File: asmcache.py
+""" Tiny-T Assembly Cache
+Tiny-T is a simple CPU Simulator intended as a teaching aid for students
+learning about computer architecture.
+This program is free software: you can redistribute it and/or modify it under
+the terms of the GNU General Public License as published by the Free Software
+Foundation, either version 2 of the License, or (at your option) any later
+version.
+This program is distributed in the hope that it will be useful, but WITHOUT
+ANY WARRANTY; without even the implied warranty of MERCHANTABILITY or FITNESS
+FOR A PARTICULAR PURPOSE. See the GNU General Public License for more details.
+You should have received a copy of the GNU General Public License along with
+this program. If not, see <http://www.gnu.org/licenses/>.
+"""
+
+__author__ = "Randall Morgan"
+__contact__ = "rmorgan@coderancher.us"
+__copyright__ = "Copyright 2022, SensorNet"
+__credits__ = ["Randall Morgan", "SensorNet.Us"]
+__date__ = "2022/05/23"
+__deprecated__ = False
+__email__ = "rmorgan@coderancher.us"
+__license__ = "GPLv2 or Later"
+__maintainer__ = "Randall Morgan"
+__status__ = "Production"
+__version__ = "1.0.0"
+
+# The assembly cache stores the result of assembling a source
+# text on disk, one JSON file per entry, named by the SHA-256 of
+# the assembler version, the target ISA and the source text.
+# Assembling text that has been seen before is then a single file
+# read.
+#
+# The cache is bounded in bytes. Each hit touches the entry's
+# modification time, and when the cache grows past its limit the
+# least recently used entries are removed first.
+
+import hashlib
+import json
+import os
+from collections import OrderedDict
+
+import assembler
+from assembler import Assembler, Lexer, uses_includes
+from isa import ISA, TINY_T
+
+
+class AssemblyCache:
+    def __init__(self, directory: str, max_bytes: int = 16 * 1024 * 1024):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        os.makedirs(directory, exist_ok=True)
+
+        # Index of key -> entry size in bytes, least recently used first
+        self.entries = OrderedDict()
+        self.total_bytes = 0
+        found = []
+        for entry in os.scandir(directory):
+            if entry.name.endswith('.json') and entry.is_file():
+                info = entry.stat()
+                found.append((info.st_mtime, entry.name[:-5], info.st_size))
+        for _, key, size in sorted(found):
+            self.entries[key] = size
+            self.total_bytes += size
+
+    @staticmethod
+    def key(text: str, isa: ISA = TINY_T) -> str:
+        digest = hashlib.sha256(assembler.__version__.encode())
+        digest.update(b'\0' + isa.name.encode() + b'\0')
+        digest.update(text.encode())
+        return digest.hexdigest()
+
+    def path(self, key: str) -> str:
+        return os.path.join(self.directory, key + '.json')
+
+    def lookup(self, text: str, isa: ISA = TINY_T):
+        # Returns (words, symbol_table) or None
+        key = self.key(text, isa)
+        path = self.path(key)
+        try:
+            with open(path, 'rb') as fh:
+                data = fh.read()
+            entry = json.loads(data)
+            os.utime(path)
+        except (OSError, ValueError):
+            self.misses += 1
+            self.total_bytes -= self.entries.pop(key, 0)
+            return None
+
+        # Another process may have written the entry, so re-index it
+        self.hits += 1
+        self.total_bytes += len(data) - self.entries.pop(key, 0)
+        self.entries[key] = len(data)
+        words = [tuple(pair) for pair in entry['words']]
+        return words, entry['symbols']
+
+    def store(self, text: str, words, symbol_table: dict, isa: ISA = TINY_T):
+        key = self.key(text, isa)
+        data = json.dumps({'words': words, 'symbols': symbol_table}, separators=(',', ':')).encode()
+
+        # Write to a temporary file first so a reader in another
+        # process never sees a partial entry.
+        path = self.path(key)
+        temp = f'{path}.{os.getpid()}.tmp'
+        with open(temp, 'wb') as fh:
+            fh.write(data)
+        os.replace(temp, path)
+
+        self.total_bytes += len(data) - self.entries.pop(key, 0)
+        self.entries[key] = len(data)
+        self.evict()
+
+    def evict(self):
+        while self.total_bytes > self.max_bytes and len(self.entries) > 1:
+            key, size = self.entries.popitem(last=False)
+            self.total_bytes -= size
+            self.evictions += 1
+            try:
+                os.remove(self.path(key))
+            except FileNotFoundError:
+                pass
+
+    def assemble(self, text: str, filename: str = '<source>', isa: ISA = TINY_T):
+        # Returns (words, symbol_table), assembling on a miss.
+        # Included files are not part of the key, so sources that
+        # include others are always assembled.
+        cacheable = not uses_includes(text)
+        result = self.lookup(text, isa) if cacheable else None
+        if result is None:
+            asm = Assembler(Lexer(isa.opcodes), text, filename, isa)
+            asm.collect()
+            result = asm.words(), asm.symbol_table
+            if cacheable:
+                self.store(text, *result, isa)
+        return result
+
+    def clear(self):
+        for key in self.entries:
+            try:
+                os.remove(self.path(key))
+            except FileNotFoundError:
+                pass
+        self.entries.clear()
+        self.total_bytes = 0
+
+    def stats(self) -> dict:
+        lookups = self.hits + self.misses
+        return {
+            'hits': self.hits,
+            'misses': self.misses,
+            'evictions': self.evictions,
+            'entries': len(self.entries),
+            'bytes': self.total_bytes,
+            'max_bytes': self.max_bytes,
+            'hit_rate': self.hits / lookups if lookups else 0.0,
+        }
@@ -25,220 +25,821 @@ __email__ = "rmorgan@coderancher.us"
 __license__ = "GPLv2 or Later"
 __maintainer__ = "Randall Morgan"
 __status__ = "Production"
-__version__ = "1.0.0"
-
-# Tiny-T CPU Instructions
-# OPCODE | Mnemonic | Description
-# -----------------------------------------------------
-# 0xxx | HLT       | Halt
-# 1xxx | LDA (xxx) | Load Acc
-# 2xxx | STA (xxx) | Store A at Mem[xxx]
-# 3xxx | ADD (xxx) | Add Mem[xxx] to Acc
-# 4xxx | SUB (xxx) | Subtract Mem[xxx] from Acc
-# 5xxx | AND (xxx) | Logical ADN ACC and Mem[xxx]
-# 6xxx | OR  (xxx) | Logical OR ACC and Mem[xxx]
-# 7xxx | XOR (xxx) | Logical XOR ACC and Mem[xxx]
-# 8xxx | NOT       | Bitwise Invert ACC
-# 9xxx | SHL       | Shift ACC left one bit
-# Axxx | SHR       | Shift ACC right one bit
-# Baaa | BRA aaa   | Unconditional branch to address aaa
-# Caaa | BRP aaa   | Branch on positive to aaa
-# Daaa | BRZ aaa   | Branch on zero to aaa
-# E0pp | INP pp    | ACC <- I/O port[pp]
-# F0pp | OUT pp    | I/O port[pp] <- ACC
-#
+__version__ = "1.3.1"
 
+import os
+import re
 
+from isa import ISAS, TINY_T, ISA
+from tokenizer import (COMMENT, DIRECTIVE, ERROR, IDENTIFIER, LABEL, MNEMONIC, NUMBER, OPERATOR, STRING, Token,
+                       Tokenizer, is_number, number_value)
+
+# The instruction sets the assembler can target are described
+# in isa.py. Tiny-T is the default.
 # Opcode table relates mnemonics
 # to the corresponding opcode value.
-OPCODE_TABLE = {
-    'htl': 0x0,
-    'lda': 0x1,
-    'sta': 0x2,
-    'add': 0x3,
-    'sub': 0x4,
-    'and': 0x5,
-    'or': 0x6,
-    'xor': 0x7,
-    'not': 0x8,
-    'shl': 0x9,
-    'shr': 0xA,
-    'bra': 0xB,
-    'brp': 0xC,
-    'brz': 0xD,
-    'inp': 0xE,
-    'out': 0xF
-}
+OPCODE_TABLE = TINY_T.opcodes
+
+
+MAX_NESTING = 32
+
+# Tokens that may appear as a term of an operand expression.
+# Symbols may share a name with a mnemonic.
+TERMS = {NUMBER, IDENTIFIER, MNEMONIC}
 
 
 class Lexer:
-    def __init__(self):
+    def __init__(self, mnemonics=OPCODE_TABLE):
+        self.tokenizer = Tokenizer(mnemonics)
         self.line = None
         self.tokens = []
+        self.position = 0
 
     def set_text(self, line: str):
         self.line = line
-        self.tokens = line.split()
+        self.tokens = self.tokenizer.tokens(line)
+        self.position = 0
 
     def next_token(self):
-        if not self.tokens:
+        if self.position >= len(self.tokens):
             return None
-        tok = self.tokens.pop(0)
+        tok = self.tokens[self.position]
+        self.position += 1
         return tok
 
+    def rest_of_line(self) -> list:
+        # Remaining tokens up to any comment. A comment is
+        # always the last token of a line.
+        tokens = self.tokens[self.position:]
+        self.position = len(self.tokens)
+        if tokens and tokens[-1].kind == COMMENT:
+            tokens.pop()
+        return tokens
+
+
+def uses_includes(text: str) -> bool:
+    return 'include.' in text.lower()
+
+
+def uses_preprocessor(text: str) -> bool:
+    # Sources that never mention MACRO. or INCLUDE. skip the
+    # preprocessor. A plain substring test is much cheaper than
+    # a regular expression over a large source.
+    text = text.lower()
+    return 'macro.' in text or 'include.' in text
+
+
+def to_text(words, isa: ISA = TINY_T) -> str:
+    # Format (address, word) pairs as the text .bin format
+    line_format = isa.line_format
+    return ''.join([line_format.format(addr, bin_code) for addr, bin_code in words])
+
+
+class Expression:
+    """ A sum of signed numbers and symbols, kept until the
+    symbols can be resolved.
+    """
+
+    def __init__(self, terms: list):
+        self.terms = terms
+
+    def symbols(self) -> list[str]:
+        return [term for sign, term in self.terms if isinstance(term, str)]
+
+    def evaluate(self, symbol_table: dict) -> int:
+        total = 0
+        for sign, term in self.terms:
+            if isinstance(term, str):
+                if term not in symbol_table:
+                    msg = f"Undefined Symbol: {term}"
+                    raise ValueError(msg)
+                term = symbol_table[term]
+            total += sign * term
+        return total
+
+    def __str__(self) -> str:
+        text = ''.join(f"{'-' if sign < 0 else '+'}{term}" for sign, term in self.terms)
+        return text.lstrip('+')
+
+
+class SourceError(ValueError):
+    """ A ValueError raised while parsing a line, with the column
+    of the token it is about when there is one.
+    """
+
+    def __init__(self, message: str, tok: Token = None):
+        super().__init__(message)
+        self.column = tok.column if tok is not None else None
+
+
+class Diagnostic:
+    """ An error found while assembling, with the file, line and
+    column it was found at. Lines and columns count from 1.
+    """
+
+    def __init__(self, filename: str, line: int, column: int, message: str, index: int = -1):
+        self.filename = filename
+        self.line = line
+        self.column = column
+        self.message = message
+        # Position in the expanded source, used to sort the report
+        self.index = index
+
+    def __str__(self) -> str:
+        return f'{self.filename}:{self.line}:{self.column}: error: {self.message}'
+
+    def to_dict(self) -> dict:
+        return {
+            'file': self.filename,
+            'line': self.line,
+            'column': self.column,
+            'severity': 'error',
+            'message': self.message,
+        }
+
+
+class Statement:
+    """ The parsed form of a single line of source. A line may
+    declare labels, set the origin, define a constant, hold one
+    instruction, or hold a block of data words. Operands and data
+    values are ints, symbol names or Expressions to be resolved
+    during fixup.
+    """
+
+    def __init__(self):
+        self.labels = []
+        self.exports = []
+        self.imports = []
+        self.origin = None
+        self.value = None
+        self.opcode = None
+        self.operand = 0
+        self.data = None
+
+    @property
+    def size(self) -> int:
+        # Number of words the statement places in memory
+        if self.data is not None:
+            return len(self.data)
+        return 0 if self.opcode is None else 1
+
+    def operands(self) -> list:
+        # Values to resolve, one per word placed
+        if self.data is not None:
+            return self.data
+        return [] if self.opcode is None else [self.operand]
+
+
+# Include files and macro expansions are kept between
+# assemblies. Includes are re-read when the file changes.
+INCLUDE_CACHE = {}
+EXPANSION_CACHE = {}
+EXPANSION_CACHE_SIZE = 4096
+
+# Finds the strings and comments of a macro body line
+LITERALS = Tokenizer()
+
+
+def substitute(line: str, replace) -> str:
+    # Apply replace to the text of line outside strings and
+    # comments, so DB. "a@b" and # notes are copied unchanged.
+    if '"' not in line and '#' not in line:
+        return replace(line)
+    parts = []
+    position = 0
+    for tok in LITERALS.tokens(line):
+        if tok.kind in (STRING, COMMENT):
+            start = tok.column - 1
+            end = start + len(tok.text)
+            parts.append(replace(line[position:start]))
+            parts.append(line[start:end])
+            position = end
+    parts.append(replace(line[position:]))
+    return ''.join(parts)
+
+
+class Macro:
+    def __init__(self, name: str, params: list[str], body: list[str]):
+        self.name = name
+        self.params = params
+        self.body = body
+        self.key = (name, tuple(params), tuple(body))
+        self.pattern = None
+        if params:
+            names = '|'.join(re.escape(param) for param in params)
+            self.pattern = re.compile(rf'\b(?:{names})\b', re.IGNORECASE)
+
+    def expand(self, args: list[str]) -> list[str]:
+        if len(args) != len(self.params):
+            msg = f'Macro {self.name} expects {len(self.params)} arguments, got {len(args)}'
+            raise ValueError(msg)
+
+        key = (self.key, tuple(args))
+        lines = EXPANSION_CACHE.get(key)
+        if lines is None:
+            lines = self.body
+            if self.pattern is not None:
+                values = dict(zip(self.params, args))
+
+                def replace(text: str) -> str:
+                    return self.pattern.sub(lambda match: values[match.group(0).lower()], text)
+
+                lines = [substitute(line, replace) for line in lines]
+            if len(EXPANSION_CACHE) >= EXPANSION_CACHE_SIZE:
+                EXPANSION_CACHE.clear()
+            EXPANSION_CACHE[key] = lines
+        return lines
+
+
+class Preprocessor:
+    """ Expands INCLUDE. files and MACRO. definitions into plain
+    source lines.
+
+        INCLUDE. "lib/mul.asm"
+
+        add2: MACRO. src, dst     # Definition
+              LDA src
+              ADD src
+              STA dst
+              ENDM.
+
+              add2 count, total   # Use
+
+    An @ in a macro body is replaced with a number unique to each
+    expansion, so loop@: gives every expansion its own label.
+    Parameters and @ are not replaced inside strings or comments.
+    """
+
+    def __init__(self, include_path: list[str] = None):
+        self.include_path = include_path or []
+        self.macros = {}
+        self.expansions = 0
+        self.lines = []
+        self.origins = []
+        self.where = ('<source>', 0)
+
+    def run(self, text: str, filename: str = '<source>') -> list[str]:
+        # Returns the expanded lines. self.origins holds the
+        # (file, line number) each expanded line came from.
+        self.lines = []
+        self.origins = []
+        self.expand(text.split('\n'), filename, 0)
+        return self.lines
+
+    @staticmethod
+    def tokens(line: str) -> list[str]:
+        tokens = []
+        for tok in line.split():
+            if tok.startswith('#'):
+                break
+            tokens.append(tok)
+        return tokens
+
+    def read(self, name: str, including: str) -> tuple[str, list[str]]:
+        folders = [os.path.dirname(including)] + self.include_path
+        for folder in folders:
+            path = os.path.join(folder, name)
+            try:
+                info = os.stat(path)
+            except OSError:
+                continue
+            cached = INCLUDE_CACHE.get(path)
+            if cached is None or cached[0] != (info.st_mtime_ns, info.st_size):
+                with open(path, 'r') as ifh:
+                    cached = ((info.st_mtime_ns, info.st_size), ifh.read().split('\n'))
+                INCLUDE_CACHE[path] = cached
+            return path, cached[1]
+
+        raise ValueError(f'Include file not found: {name}')
+
+    def expand(self, lines: list[str], filename: str, depth: int, origin=None):
+        if depth > MAX_NESTING:
+            raise ValueError('Macros or includes nested too deeply')
+
+        definition = None
+        for number, line in enumerate(lines, 1):
+            where = origin or (filename, number)
+            self.where = where
+            tokens = self.tokens(line)
+
+            if definition is not None:
+                # MACRO BODY
+                name, params, body = definition
+                if tokens and tokens[0].lower() == 'endm.':
+                    self.macros[name] = Macro(name, params, body)
+                    definition = None
+                else:
+                    body.append(line)
+                continue
+
+            labels = []
+            while tokens and tokens[0].endswith(':'):
+                labels.append(tokens.pop(0))
+            head = tokens[0].lower() if tokens else ''
+
+            if head == 'macro.':
+                if len(labels) != 1:
+                    raise ValueError(f'MACRO. needs exactly one name label at {filename}:{number}')
+                params = [param.lower() for param in ' '.join(tokens[1:]).replace(',', ' ').split()]
+                definition = (labels[0][:-1].lower(), params, [])
+                continue
+
+            if labels and (head == 'include.' or head in self.macros):
+                # Keep the labels on a line of their own
+                self.lines.append(' '.join(labels))
+                self.origins.append(where)
+
+            if head == 'include.':
+                name = ' '.join(tokens[1:]).strip('"\'')
+                path, included = self.read(name, filename)
+                self.expand(included, path, depth + 1, origin)
+
+            elif head in self.macros:
+                self.expansions += 1
+                args = [arg.strip() for arg in ' '.join(tokens[1:]).split(',') if arg.strip()]
+                body = self.macros[head].expand(args)
+                suffix = f'_{self.expansions}'
+                body = [substitute(line_, lambda text: text.replace('@', suffix)) for line_ in body]
+                self.expand(body, filename, depth + 1, where)
+
+            else:
+                self.lines.append(line)
+                self.origins.append(where)
+
+        if definition is not None:
+            raise ValueError(f'MACRO. {definition[0]} is missing ENDM. in {filename}')
+
 
 class Assembler:
-    def __init__(self, lexer: Lexer, _text: str):
+    """ The assembler engine. The target instruction set is given
+    by an ISA object, and the lexer must be built for the same
+    mnemonics, e.g. Assembler(Lexer(TINY_P.opcodes), text, isa=TINY_P).
+    """
+
+    def __init__(self, lexer: Lexer, _text: str, filename: str = '<source>', isa: ISA = TINY_T):
+        if lexer.tokenizer.mnemonics != frozenset(isa.opcodes):
+            raise ValueError(f'The lexer was not built for the {isa.name} mnemonics')
+        self.isa = isa
         self.text = _text
+        self.filename = filename
         self.lines = self.text.split('\n')
+        self.origins = None
         self.current_address = 0
         self.opcode = 0
         self.operand = 0
         self.lexer = lexer
         self.symbol_table = {}
+        self.constants = set()
+        self.exports = []
+        self.imports = []
         self.code = []
-
-    def skip_spaces(self, tok: str):
-        while tok.isspace():
-            tok = self.lexer.next_token()
-
-    def skip_comment(self, tok: str):
-        if tok == '#':
-            while tok:
-                tok = self.lexer.next_token()
+        self.code_lines = []
+        self.include_path = []
+        self.statements = []
+        self.optimizer = None
+        # Set to a list to collect errors instead of raising them
+        self.diagnostics = None
+
+    def preprocess(self):
+        # Expand macros and includes. Sources that use neither
+        # are assembled as written.
+        if uses_preprocessor(self.text):
+            preprocessor = Preprocessor(self.include_path)
+            try:
+                self.lines = preprocessor.run(self.text, self.filename)
+            except ValueError as error:
+                if self.diagnostics is None:
+                    raise
+                # Without the expansion there is nothing to assemble
+                filename, number = preprocessor.where
+                self.diagnostics.append(Diagnostic(filename, number, 1, str(error)))
+                self.lines = []
+                self.origins = []
+                return
+            self.origins = preprocessor.origins
 
     def is_hex(self, tok: str) -> bool:
-        if tok.startswith('0x') or tok.startswith('0X'):
-            try:
-                op = int(tok[2:], 16)
-            except ValueError:
-                return False
-            return True
-        return False
+        return tok[:2].lower() == '0x' and is_number(tok)
 
     def from_hex(self, tok: str) -> str:
         if self.is_hex(tok):
-            val = str(int(tok[2:], 16))
+            val = str(number_value(tok))
             return val
 
         msg = f"Can not convert {tok} to integer value"
         raise ValueError(msg)
 
-    def fixup(self):
-        text_ = ''
-        for line in self.code:
-            parts = line.split(':')
-            addr = parts[0]
-            sub_parts = parts[1].split('-')
-            opcode = sub_parts[0]
-            operand = sub_parts[1]
-
-            if operand.isalnum() and not operand.isnumeric() and not self.is_hex(operand):
-                if operand in self.symbol_table:
-                    operand = self.symbol_table[operand]
+    def parse_number(self, tok: Token, what: str) -> int:
+        if tok is not None and tok.kind == NUMBER:
+            return number_value(tok.text)
+
+        msg = f'Illegal {what}. Expected: integer, Found {tok.text if tok else None}'
+        raise SourceError(msg, tok)
+
+    def join(self, tokens: list[Token]) -> str:
+        # The source text the tokens were read from
+        if not tokens:
+            return ''
+        start = tokens[0].column - 1
+        end = tokens[-1].column - 1 + len(tokens[-1].text)
+        return self.lexer.line[start:end]
+
+    def parse_expression(self, tokens: list[Token], what: str):
+        # Operand expressions are sums of numbers and symbols, such
+        # as table+1 or end-start. Returns an int, a symbol name, or
+        # an Expression.
+        if len(tokens) == 1:
+            kind, text, column = tokens[0]
+            if kind == NUMBER:
+                return number_value(text)
+            elif kind in TERMS:
+                return text
+
+        terms = []
+        sign = None
+        for tok in tokens:
+            if tok.kind == OPERATOR and tok.text != ',' and sign is None:
+                sign = -1 if tok.text == '-' else 1
+            elif tok.kind in TERMS and (sign is not None or not terms):
+                term = number_value(tok.text) if tok.kind == NUMBER else tok.text
+                terms.append((sign or 1, term))
+                sign = None
+            else:
+                raise SourceError(f'Illegal {what}: {self.join(tokens)}', tok)
+
+        if sign is not None:
+            raise SourceError(f'Illegal {what}: {self.join(tokens)}', tokens[-1])
+        if not terms:
+            raise SourceError(f'Missing {what}')
+
+        symbols = [term for sign, term in terms if isinstance(term, str)]
+        if not symbols:
+            return sum(sign * term for sign, term in terms)
+        elif len(terms) == 1 and terms[0][0] > 0:
+            return symbols[0]
+        return Expression(terms)
+
+    def rest_of_line(self) -> list[Token]:
+        return self.lexer.rest_of_line()
+
+    def end_of_line(self, directive: Token):
+        # Directives that take a single value allow nothing after it
+        extra = self.rest_of_line()
+        if extra:
+            raise SourceError(f'Unexpected {self.join(extra)} after {directive.text.upper()}', extra[0])
+
+    @staticmethod
+    def split_items(tokens: list[Token]) -> list[list[Token]]:
+        # Split a list of tokens at the commas
+        items = [[]]
+        for tok in tokens:
+            if tok.kind == OPERATOR and tok.text == ',':
+                items.append([])
+            else:
+                items[-1].append(tok)
+        return items
+
+    def parse_operand(self, tokens: list[Token]):
+        # Instructions such as NOT and HLT may omit the operand
+        if not tokens:
+            return 0
+
+        operand = self.parse_expression(tokens, 'Operand')
+        if isinstance(operand, int) and not 0 <= operand <= self.isa.operand_max:
+            raise SourceError(f"Illegal Operand Value {self.join(tokens)}", tokens[0])
+        return operand
+
+    def parse_names(self) -> list[str]:
+        # Symbol names listed after a directive, separated
+        # by spaces or commas.
+        names = []
+        for tok in self.rest_of_line():
+            if tok.kind in (IDENTIFIER, MNEMONIC):
+                names.append(tok.text)
+            elif tok.kind != OPERATOR or tok.text != ',':
+                raise SourceError(f'Illegal symbol name: {tok.text}', tok)
+        return names
+
+    def parse_data(self) -> list:
+        # DW. values: expressions separated by commas
+        tokens = self.rest_of_line()
+        if not tokens:
+            raise ValueError('DW. needs at least one value')
+        values = []
+        for item in self.split_items(tokens):
+            value = self.parse_expression(item, 'Data Word')
+            if isinstance(value, int) and not self.isa.word_min <= value <= self.isa.word_max:
+                raise SourceError(f'Data word out of range: {self.join(item)}', item[0])
+            values.append(value)
+        return values
+
+    def parse_bytes(self) -> list[int]:
+        # DB. items are "quoted strings" with C style escapes, or
+        # byte values. They are packed two bytes to a word, high
+        # byte first, and padded with a zero byte to a whole word.
+        if self.isa.word_max < 0xFFFF:
+            raise ValueError(f'DB. needs 16 bit words, which {self.isa.name} does not have')
+        data = bytearray()
+        tokens = self.rest_of_line()
+        if not tokens:
+            raise ValueError('DB. needs at least one value')
+        items = self.split_items(tokens)
+        if len(items) > 1 and not items[-1]:
+            # A trailing comma is allowed
+            items.pop()
+        for item in items:
+            if len(item) != 1 or item[0].kind not in (STRING, NUMBER):
+                raise SourceError(f'Illegal DB. value: {self.join(item)}', item[0] if item else None)
+            tok = item[0]
+            if tok.kind == STRING:
+                text = tok.text[1:-1]
+                try:
+                    data += text.encode('latin-1').decode('unicode_escape').encode('latin-1')
+                except UnicodeError:
+                    raise SourceError(f'Illegal character in DB. string: {text}', tok)
+            else:
+                value = number_value(tok.text)
+                if value > 0xFF:
+                    raise SourceError(f'Byte value out of range: {tok.text}', tok)
+                data.append(value)
+
+        if len(data) % 2:
+            data.append(0)
+        return [(data[i] << 8) | data[i + 1] for i in range(0, len(data), 2)]
+
+    def parse_statement(self, line: str) -> Statement:
+        statement = Statement()
+        self.lexer.set_text(line)
+
+        tok = self.lexer.next_token()
+        while tok is not None:
+            if tok.kind == COMMENT:
+                break
+
+            elif tok.kind == LABEL:
+                # LABEL_DECL
+                statement.labels.append(tok.text[:-1])
+
+            elif tok.kind == DIRECTIVE:
+                directive = tok.text[:-1]
+                if directive == 'org':
+                    statement.origin = self.parse_number(self.lexer.next_token(), 'Origin')
+                    self.end_of_line(tok)
+                elif directive == 'export':
+                    statement.exports = self.parse_names()
+                elif directive == 'import':
+                    statement.imports = self.parse_names()
+                elif directive == 'equ':
+                    if not statement.labels:
+                        raise SourceError('EQU. needs a label to name the constant', tok)
+                    statement.value = self.parse_expression(self.rest_of_line(), 'Constant')
+                elif directive == 'dw':
+                    statement.data = self.parse_data()
+                elif directive == 'ds':
+                    statement.data = [0] * self.parse_number(self.lexer.next_token(), 'Block Size')
+                    self.end_of_line(tok)
+                elif directive == 'db':
+                    statement.data = self.parse_bytes()
                 else:
-                    msg = f"Undefined Symbol: {operand}"
-                    raise ValueError(msg)
-            elif self.is_hex(operand):
-                operand = self.from_hex(operand)
-
-            bin_code = (int(opcode) << 12) + int(operand)
-            if bin_code > 0xFFFF:
-                raise ValueError(f"Illegal Machine Code Value {bin_code}")
-            code_line = f'{addr.zfill(4)} {bin_code}\n'
-            text_ += code_line
-
-        return text_
-
-    def parse(self):
-        for line in self.lines:
-            line = line.lower()
-            self.opcode = 0
-            self.operand = 0
-
-            self.lexer.set_text(line)
+                    raise SourceError(f'Unknown directive: {tok.text}', tok)
+                break
+
+            elif tok.kind == MNEMONIC:
+                # INSTRUCTION
+                statement.opcode = self.isa.opcodes[tok.text]
+                statement.operand = self.parse_operand(self.rest_of_line())
+                break
+
+            elif tok.kind in (IDENTIFIER, ERROR):
+                # A name that is not a label, directive or mnemonic,
+                # such as a misspelt instruction, or text that is no
+                # token at all. The message quotes the whole word.
+                word = self.lexer.line[tok.column - 1:].split('#')[0].split()[0]
+                if tok.kind == IDENTIFIER and word.lower() == tok.text:
+                    raise SourceError(f'Unknown instruction: {word}', tok)
+                raise SourceError(f'Illegal token: {word}', tok)
 
             tok = self.lexer.next_token()
-            code_text = ''
-            while tok is not None:
-                self.skip_spaces(tok)
 
-                if tok is None or not tok:
-                    break
-
-                elif tok.endswith(':'):
-                    # LABEL _DECL
-                    key = tok[:-1]
-                    self.symbol_table[key] = self.current_address
-
-                elif tok == '#':
-                    # COMMENT
-                    self.skip_comment(tok)
+        return statement
+
+    def parse_line(self, index: int, line: str) -> Statement:
+        try:
+            return self.parse_statement(line)
+        except ValueError as error:
+            if self.diagnostics is None:
+                raise
+            self.report(index, error)
+            # Keep the labels so their uses are not reported too
+            statement = Statement()
+            for tok in line.lower().split():
+                if not tok.endswith(':'):
                     break
+                statement.labels.append(tok[:-1])
+            return statement
+
+    def report(self, index: int, error: ValueError):
+        # Record an error against expanded line index. The column is
+        # that of the token the error names. Errors found after
+        # parsing, such as undefined symbols, carry no column: for
+        # those it is that of the value the message names, when it
+        # can be found on the line, otherwise that of the first
+        # token after any labels.
+        message = str(error)
+        column = getattr(error, 'column', None)
+        if column is not None:
+            filename, number = self.origin(index)
+            self.diagnostics.append(Diagnostic(filename, number, column, message, index))
+            return
+
+        line = self.lines[index].split('#')[0].lower()
+        column = len(line) - len(line.lstrip()) + 1
+        for match in re.finditer(r'\S+', line):
+            if not match.group().endswith(':'):
+                column = match.start() + 1
+                break
+        names = message.split()
+        if names:
+            name = names[-1].lower()
+            found = re.search(rf'(?<![\w.]){re.escape(name)}(?![\w])', line[column - 1:])
+            if found:
+                column += found.start()
+        filename, number = self.origin(index)
+        self.diagnostics.append(Diagnostic(filename, number, column, message, index))
+
+    def resolve(self, operand) -> int:
+        # Replace a symbol name or expression with its value
+        if isinstance(operand, str):
+            if operand not in self.symbol_table:
+                msg = f"Undefined Symbol: {operand}"
+                raise ValueError(msg)
+            return self.symbol_table[operand]
+        elif isinstance(operand, Expression):
+            return operand.evaluate(self.symbol_table)
+        return operand
+
+    def encode(self, opcode: int, operand: int) -> int:
+        # An opcode of None marks a data word
+        return self.isa.encode(opcode, operand)
+
+    def words(self) -> list[tuple[int, int]]:
+        # Resolved (address, machine word) pairs in source order
+        if self.diagnostics is None:
+            return [(addr, self.encode(opcode, self.resolve(operand))) for addr, opcode, operand in self.code]
+
+        # Words in error are reported and left as 0
+        words = []
+        for (addr, opcode, operand), index in zip(self.code, self.code_lines):
+            try:
+                word = self.encode(opcode, self.resolve(operand))
+            except ValueError as error:
+                self.report(index, error)
+                word = 0
+            words.append((addr, word))
+        return words
 
-                elif tok.endswith('.'):
-                    # DIRECTIVE
-                    if tok[:-1] == 'org':
-                        operand = self.lexer.next_token()
-                        if operand.isnumeric():
-                            self.current_address = int(operand)
-
-                        elif self.is_hex(operand):
-                            try:
-                                operand = int(operand[2:], 16)
-                            except ValueError:
-                                msg = f'Illegal value given. Expected int or hex, got {operand}'
-                                raise ValueError(msg)
-
-                        else:
-                            msg = f'Illegal Origin. Expected: integer, Found {operand}'
-                            raise ValueError(msg)
-                        break
-                elif tok in OPCODE_TABLE.keys():
-
-                    # INSTRUCTION
-                    self.opcode = OPCODE_TABLE[tok]
-                    operand = self.lexer.next_token()
-                    if operand.isnumeric():
-                        self.operand = operand
-
-                    elif self.is_hex(operand):
-                        self.operand = self.from_hex(operand)
-
-                    elif operand.isalnum():
-                        if operand in self.symbol_table:
-                            self.operand = self.symbol_table[operand]
-
-                        elif self.is_hex(operand):
-                            self.operand = self.from_hex(operand)
-
-                        else:
-                            self.operand = operand
-                    elif operand.startswith('#'):
-                        self.operand = 0
-                        self.skip_comment(operand)
-
-                    self.code.append(f"{self.current_address} : {self.opcode}-{self.operand}")
+    def fixup(self):
+        return to_text(self.words(), self.isa)
+
+    def collect(self):
+        # First pass: lay out the code and build the symbol table.
+        # The optional optimizer runs between parsing and layout.
+        self.preprocess()
+        self.statements = [self.parse_line(index, line) for index, line in enumerate(self.lines)]
+        if self.optimizer is not None:
+            self.statements = self.optimizer.optimize(self.statements)
+
+        outside = False
+        for index, statement in enumerate(self.statements):
+            if statement.value is not None:
+                # Constants must be defined before they are used
+                try:
+                    value = self.resolve(statement.value)
+                except ValueError as error:
+                    if self.diagnostics is None:
+                        raise
+                    self.report(index, error)
+                    value = 0
+                for label in statement.labels:
+                    self.symbol_table[label] = value
+                    self.constants.add(label)
+            else:
+                for label in statement.labels:
+                    self.symbol_table[label] = self.current_address
+
+            self.exports.extend(statement.exports)
+            self.imports.extend(statement.imports)
+
+            if statement.origin is not None:
+                self.current_address = statement.origin
+                outside = False
+
+            end = self.current_address + statement.size
+            if end > self.isa.address_space and not outside:
+                # Reported once until the next ORG.
+                outside = True
+                error = ValueError(f'Address {end - 1} is outside the {self.isa.name} address space')
+                if self.diagnostics is None:
+                    raise error
+                self.report(index, error)
+
+            if statement.opcode is not None:
+                self.opcode = statement.opcode
+                self.operand = statement.operand
+                self.code.append((self.current_address, self.opcode, self.operand))
+                self.code_lines.append(index)
+                self.current_address += 1
+
+            elif statement.data is not None:
+                # Data blocks occupy consecutive addresses, so they
+                # become single segments of a packed image.
+                for value in statement.data:
+                    self.code.append((self.current_address, None, value))
+                    self.code_lines.append(index)
                     self.current_address += 1
 
-                tok = self.lexer.next_token()
-
+    def parse(self):
+        self.collect()
         code_text = self.fixup()
 
         return code_text
 
+    def origin(self, index: int) -> tuple[str, int]:
+        # Source file and line number of expanded line index
+        if self.origins is None:
+            return self.filename, index + 1
+        return self.origins[index]
+
+    def listing(self, words=None) -> str:
+        """ Return the listing of an assembled program: address,
+        machine word, source line number and the source text for
+        every line. Words placed by a DW., DS. or DB. line after its
+        first are listed below it without text. Lines from INCLUDE.
+        files follow a ; <file> line naming the file they are from.
+        """
+        if words is None:
+            words = self.words()
+        placed = {}
+        for (addr, word), index in zip(words, self.code_lines):
+            placed.setdefault(index, []).append((addr, word))
+
+        fmt = self.isa.format_word
+        lines = [f'; {self.filename}', 'ADDR  WORD   LINE  SOURCE']
+        current = self.filename
+        for index, text in enumerate(self.lines):
+            filename, number = self.origin(index)
+            if filename != current:
+                lines.append(f'; {filename}')
+                current = filename
+            pairs = placed.get(index, ())
+            if pairs:
+                addr, word = pairs[0]
+                lines.append(f'{fmt(addr):>4}  {fmt(word):>4}  {number:5d}  {text}'.rstrip())
+                lines.extend(f'{fmt(addr):>4}  {fmt(word):>4}' for addr, word in pairs[1:])
+            else:
+                lines.append(f'            {number:5d}  {text}'.rstrip())
+
+        lines.append('')
+        lines.append('SYMBOL                VALUE')
+        for name, value in sorted(self.symbol_table.items(), key=lambda item: (item[1], item[0])):
+            kind = ' EQU.' if name in self.constants else ''
+            lines.append(f'{name:20s}  {fmt(value):>4}{kind}')
+        return '\n'.join(lines) + '\n'
+
 
 import getopt
+import json
 import sys
 
+import hexfile
+import packed
+
+# Reported for a source that places no words, such as one holding
+# only EQU. constants, as there is no image to write
+NO_WORDS = 'Nothing to assemble: the source places no code or data words'
+
 
 def main(argv):
     inputfile = ''
     outputfile = ''
-    usage_message = "Usage: assembler.py -i <inputfile> -o <outputfile>"
+    binary = False
+    relocatable = False
+    optimize = False
+    cache_dir = ''
+    listing = False
+    keep_going = False
+    json_output = False
+    isa = TINY_T
+    image_format = 'bin'
+    usage_message = ("Usage: assembler.py [-t <target>] [-b | -r | -f <format>] [-O] [-l] [-k [--json]] "
+                     "[-c <cachedir>] -i <inputfile> -o <outputfile>\n"
+                     f"Targets: {', '.join(ISAS)}\n"
+                     "Formats: bin, hex (Intel HEX), srec (Motorola S-record)")
 
     try:
-        opts, args = getopt.getopt(argv, "hi:0:", ["help", "ifile=", "ofile="])
+        opts, args = getopt.getopt(argv, "hbrOlkt:f:c:i:o:",
+                                   ["help", "binary", "relocatable", "optimize", "listing", "keep-going", "json",
+                                    "target=", "format=", "cache=", "ifile=", "ofile="])
     except getopt.GetoptError:
         print(usage_message)
         sys.exit(2)
@@ -251,34 +852,140 @@ def main(argv):
             inputfile = arg
         elif opt in ('-o', '--ofile'):
             outputfile = arg
+        elif opt in ('-b', '--binary'):
+            binary = True
+        elif opt in ('-c', '--cache'):
+            cache_dir = arg
+        elif opt in ('-r', '--relocatable'):
+            relocatable = True
+        elif opt in ('-O', '--optimize'):
+            optimize = True
+        elif opt in ('-l', '--listing'):
+            listing = True
+        elif opt in ('-k', '--keep-going'):
+            keep_going = True
+        elif opt == '--json':
+            keep_going = True
+            json_output = True
+        elif opt in ('-t', '--target'):
+            if arg.lower() not in ISAS:
+                print(usage_message)
+                sys.exit(2)
+            isa = ISAS[arg.lower()]
+        elif opt in ('-f', '--format'):
+            if arg.lower() not in ('bin', 'hex', 'srec'):
+                print(usage_message)
+                sys.exit(2)
+            image_format = arg.lower()
 
     if not inputfile:
         print(usage_message)
         sys.exit(2)
 
-    # If only input file given default output file to <inputfile>.bin
+    # Relocation and the optimizer know only Tiny-T code
+    if isa is not TINY_T and (relocatable or optimize):
+        print(f"-r and -O are only available for {TINY_T.name}")
+        sys.exit(2)
+
+    # If only input file given default output file to <inputfile>.bin,
+    # <inputfile>.tbin for a packed binary image, <inputfile>.tto
+    # for a relocatable object module, or .hex or .srec
     if inputfile and not outputfile:
-        outputfile = inputfile.split('.')[0] + '.bin'
+        extension = '.bin'
+        if relocatable:
+            extension = '.tto'
+        elif binary:
+            extension = packed.EXTENSION
+        elif image_format == 'hex':
+            extension = hexfile.HEX_EXTENSION
+        elif image_format == 'srec':
+            extension = hexfile.SREC_EXTENSION
+        outputfile = inputfile.split('.')[0] + extension
 
     with open(inputfile, 'r') as ifh:
         program_text = ifh.read()
     ifh.close()
 
-    # Assemble program
-    assembler = Assembler(Lexer(), program_text)
-    machine_text = assembler.parse()
+    if relocatable:
+        # Imported here as the linker itself imports this module
+        from linker import ObjectModule
+        ObjectModule.assemble(program_text, inputfile).save(outputfile)
+        print(f"Assembled: {inputfile} and wrote object module to {outputfile}")
+        return
+
+    # Assemble program. Optimizing, a listing and diagnostics
+    # need the parsed source, so they bypass the cache.
+    assembler = None
+    if cache_dir and not (optimize or listing or keep_going):
+        # Imported here as the cache itself imports this module
+        from asmcache import AssemblyCache
+        words, symbol_table = AssemblyCache(cache_dir).assemble(program_text, inputfile, isa)
+    else:
+        assembler = Assembler(Lexer(isa.opcodes), program_text, inputfile, isa)
+        if optimize:
+            # Imported here as the optimizer itself imports this module
+            from peephole import PeepholeOptimizer
+            assembler.optimizer = PeepholeOptimizer()
+        if keep_going:
+            assembler.diagnostics = []
+        assembler.collect()
+        words = assembler.words()
+        if optimize and not json_output:
+            print(assembler.optimizer.report())
+
+    if keep_going:
+        # Every error in the source is reported, and no output
+        # is written when there are any.
+        diagnostics = sorted(assembler.diagnostics, key=lambda diagnostic: diagnostic.index)
+        if not diagnostics and not words:
+            diagnostics.append(Diagnostic(inputfile, 1, 1, NO_WORDS))
+        if json_output:
+            print(json.dumps({
+                'file': inputfile,
+                'errors': len(diagnostics),
+                'diagnostics': [diagnostic.to_dict() for diagnostic in diagnostics],
+            }, indent=1))
+        else:
+            for diagnostic in diagnostics:
+                print(diagnostic, file=sys.stderr)
+        if diagnostics:
+            if not json_output:
+                print(f"{len(diagnostics)} errors in {inputfile}", file=sys.stderr)
+            sys.exit(1)
+    elif not words:
+        print(Diagnostic(inputfile, 1, 1, NO_WORDS), file=sys.stderr)
+        sys.exit(1)
+    machine_text = to_text(words, isa)
 
     # Write output file
-    if machine_text:
+    if binary:
+        with open(outputfile, 'wb') as ofh:
+            ofh.write(packed.pack(words))
+        ofh.close()
+    elif image_format == 'hex':
+        with open(outputfile, 'w') as ofh:
+            ofh.write(hexfile.to_ihex(words))
+    elif image_format == 'srec':
+        with open(outputfile, 'w') as ofh:
+            ofh.write(hexfile.to_srec(words, isa.name))
+    else:
         with open(outputfile, 'w') as ofh:
             ofh.write(machine_text)
         ofh.close()
-    else:
-        msg = f'Unable to assemble output file {inputfile}'
-        raise AssertionError(msg)
+
+    if listing:
+        # The listing and map are written from the same assembly
+        from srcmap import SourceMap
+        base = os.path.splitext(outputfile)[0]
+        with open(base + '.lst', 'w') as ofh:
+            ofh.write(assembler.listing(words))
+        SourceMap.from_assembler(assembler, words).save(base + SourceMap.EXTENSION)
+        if not json_output:
+            print(f"Wrote listing to {base}.lst and source map to {base}{SourceMap.EXTENSION}")
 
     # Exit message
-    print(f"Assembled: {inputfile} and wrote machine code to {outputfile}")
+    if not json_output:
+        print(f"Assembled: {inputfile} and wrote machine code to {outputfile}")
 
 
 if __name__ == '__main__':
@@ -0,0 +1,227 @@
+#!/usr/bin/python3
+# -*- coding: utf-8 -*-
+# File: batch.py
+""" Tiny-T Batch Assembler
+Tiny-T is a simple CPU Simulator intended as a teaching aid for students
+learning about computer architecture.
+This program is free software: you can redistribute it and/or modify it under
+the terms of the GNU General Public License as published by the Free Software
+Foundation, either version 2 of the License, or (at your option) any later
+version.
+This program is distributed in the hope that it will be useful, but WITHOUT
+ANY WARRANTY; without even the implied warranty of MERCHANTABILITY or FITNESS
+FOR A PARTICULAR PURPOSE. See the GNU General Public License for more details.
+You should have received a copy of the GNU General Public License along with
+this program. If not, see <http://www.gnu.org/licenses/>.
+"""
+
+__author__ = "Randall Morgan"
+__contact__ = "rmorgan@coderancher.us"
+__copyright__ = "Copyright 2022, SensorNet"
+__credits__ = ["Randall Morgan", "SensorNet.Us"]
+__date__ = "2022/05/23"
+__deprecated__ = False
+__email__ = "rmorgan@coderancher.us"
+__license__ = "GPLv2 or Later"
+__maintainer__ = "Randall Morgan"
+__status__ = "Production"
+__version__ = "1.0.0"
+
+# The batch assembler assembles many sources at once, spread over
+# a pool of worker processes. Each worker builds its lexer once
+# and keeps its include and macro caches between files, so only
+# the first file a worker sees pays for the warm up.
+#
+# Every source is assembled in keep-going mode, so a failed file
+# lists all of its errors. A JSON manifest records, for every
+# source, the output written, the words placed, the time taken
+# and any errors.
+#
+# With -d, outputs are written below <outdir> at the same paths
+# the sources have below the deepest directory they share, so
+# a/x.asm and b/x.asm become <outdir>/a/x.bin and <outdir>/b/x.bin.
+#
+# Usage: batch.py [-t <target>] [-b] [-j <jobs>] [-d <outdir>] [-m <manifest>] <source|glob> ...
+
+import getopt
+import glob
+import json
+import os
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+import packed
+from assembler import Assembler, Lexer, to_text
+from isa import ISAS, TINY_T
+
+# Per process state, set up by start_worker()
+WORKER = {}
+
+
+def start_worker(target: str, binary: bool, outdir: str, root: str = ''):
+    isa = ISAS[target]
+    WORKER['isa'] = isa
+    WORKER['lexer'] = Lexer(isa.opcodes)
+    WORKER['binary'] = binary
+    WORKER['outdir'] = outdir
+    WORKER['root'] = root
+
+
+def source_root(sources: list[str]) -> str:
+    # The deepest directory holding every source
+    if not sources:
+        return ''
+    return os.path.commonpath([os.path.dirname(os.path.abspath(source)) for source in sources])
+
+
+def output_path(source: str, binary: bool, outdir: str, root: str = '') -> str:
+    extension = packed.EXTENSION if binary else '.bin'
+    base = os.path.splitext(source)[0]
+    if outdir:
+        if root:
+            base = os.path.relpath(os.path.abspath(base), root)
+        else:
+            base = os.path.basename(base)
+        base = os.path.join(outdir, base)
+    return base + extension
+
+
+def assemble_file(source: str) -> dict:
+    # Assemble one source in a worker and write its output.
+    # Returns the manifest entry.
+    isa = WORKER['isa']
+    binary = WORKER['binary']
+    entry = {'source': source, 'output': None, 'words': 0, 'status': 'ok', 'errors': []}
+    start = time.perf_counter()
+    try:
+        with open(source, 'r') as ifh:
+            text = ifh.read()
+        asm = Assembler(WORKER['lexer'], text, source, isa)
+        asm.diagnostics = []
+        asm.collect()
+        words = asm.words()
+    except (OSError, UnicodeError) as error:
+        entry['status'] = 'error'
+        entry['errors'] = [{'file': source, 'line': 0, 'column': 0, 'severity': 'error', 'message': str(error)}]
+        words = None
+    else:
+        if asm.diagnostics:
+            entry['status'] = 'error'
+            entry['errors'] = [diagnostic.to_dict()
+                               for diagnostic in sorted(asm.diagnostics, key=lambda diagnostic: diagnostic.index)]
+
+    if entry['status'] == 'ok':
+        path = output_path(source, binary, WORKER['outdir'], WORKER['root'])
+        if WORKER['outdir']:
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+        if binary:
+            with open(path, 'wb') as ofh:
+                ofh.write(packed.pack(words))
+        else:
+            with open(path, 'w') as ofh:
+                ofh.write(to_text(words, isa))
+        entry['output'] = path
+        entry['words'] = len(words)
+    entry['seconds'] = time.perf_counter() - start
+    return entry
+
+
+def expand_sources(patterns: list[str]) -> list[str]:
+    # Expand globs, keeping the order given and dropping repeats
+    sources = []
+    seen = set()
+    for pattern in patterns:
+        matches = sorted(glob.glob(pattern, recursive=True)) if glob.has_magic(pattern) else [pattern]
+        for source in matches:
+            if source not in seen:
+                seen.add(source)
+                sources.append(source)
+    return sources
+
+
+def assemble_all(sources: list[str], target: str = TINY_T.name, binary: bool = False, outdir: str = '',
+                 jobs: int = None) -> dict:
+    """ Assemble every source and return the manifest. The
+    entries are in the order of sources.
+    """
+    start = time.perf_counter()
+    args = (target, binary, outdir, source_root(sources))
+    if outdir:
+        os.makedirs(outdir, exist_ok=True)
+
+    if len(sources) > 1 and jobs != 1:
+        workers = jobs or os.cpu_count() or 1
+        # Several files per task keeps the pool busy without a
+        # round trip per file.
+        chunksize = max(1, len(sources) // (workers * 4))
+        with ProcessPoolExecutor(max_workers=workers, initializer=start_worker, initargs=args) as pool:
+            entries = list(pool.map(assemble_file, sources, chunksize=chunksize))
+    else:
+        start_worker(*args)
+        entries = [assemble_file(source) for source in sources]
+
+    failed = sum(1 for entry in entries if entry['status'] != 'ok')
+    return {
+        'target': target,
+        'sources': len(entries),
+        'assembled': len(entries) - failed,
+        'failed': failed,
+        'words': sum(entry['words'] for entry in entries),
+        'seconds': time.perf_counter() - start,
+        'files': entries,
+    }
+
+
+def main(argv):
+    target = TINY_T.name
+    binary = False
+    jobs = None
+    outdir = ''
+    manifest_file = 'manifest.json'
+    usage_message = ("Usage: batch.py [-t <target>] [-b] [-j <jobs>] [-d <outdir>] [-m <manifest>] "
+                     "<source|glob> [<source|glob> ...]")
+
+    try:
+        opts, args = getopt.getopt(argv, "ht:bj:d:m:",
+                                   ["help", "target=", "binary", "jobs=", "outdir=", "manifest="])
+    except getopt.GetoptError:
+        print(usage_message)
+        sys.exit(2)
+
+    for opt, arg in opts:
+        if opt in ('-h', '--help'):
+            print(usage_message)
+            sys.exit()
+        elif opt in ('-t', '--target'):
+            target = arg.lower()
+        elif opt in ('-b', '--binary'):
+            binary = True
+        elif opt in ('-j', '--jobs'):
+            jobs = int(arg)
+        elif opt in ('-d', '--outdir'):
+            outdir = arg
+        elif opt in ('-m', '--manifest'):
+            manifest_file = arg
+
+    sources = expand_sources(args)
+    if not sources or target not in ISAS:
+        print(usage_message)
+        sys.exit(2)
+
+    manifest = assemble_all(sources, target, binary, outdir, jobs)
+    with open(manifest_file, 'w') as ofh:
+        json.dump(manifest, ofh, indent=1)
+
+    for entry in manifest['files']:
+        for error in entry['errors']:
+            print(f"{error['file']}:{error['line']}:{error['column']}: error: {error['message']}", file=sys.stderr)
+
+    print(f"Assembled: {manifest['assembled']} of {manifest['sources']} sources in {manifest['seconds']:.2f}s, "
+          f"manifest written to {manifest_file}")
+    if manifest['failed']:
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main(sys.argv[1:])
@@ -0,0 +1,337 @@
+#!/usr/bin/python3
+# -*- coding: utf-8 -*-
+# File: bench.py
+""" Tiny-T Benchmark Runner
+Tiny-T is a simple CPU Simulator intended as a teaching aid for students
+learning about computer architecture.
+This program is free software: you can redistribute it and/or modify it under
+the terms of the GNU General Public License as published by the Free Software
+Foundation, either version 2 of the License, or (at your option) any later
+version.
+This program is distributed in the hope that it will be useful, but WITHOUT
+ANY WARRANTY; without even the implied warranty of MERCHANTABILITY or FITNESS
+FOR A PARTICULAR PURPOSE. See the GNU General Public License for more details.
+You should have received a copy of the GNU General Public License along with
+this program. If not, see <http://www.gnu.org/licenses/>.
+"""
+
+__author__ = "Randall Morgan"
+__contact__ = "rmorgan@coderancher.us"
+__copyright__ = "Copyright 2022, SensorNet"
+__credits__ = ["Randall Morgan", "SensorNet.Us"]
+__date__ = "2022/05/23"
+__deprecated__ = False
+__email__ = "rmorgan@coderancher.us"
+__license__ = "GPLv2 or Later"
+__maintainer__ = "Randall Morgan"
+__status__ = "Production"
+__version__ = "1.0.0"
+
+# The benchmark corpus is in bench/, listed in bench/benchmarks.json
+# with the values each program must leave in memory, named by label:
+#
+#   {"name": "mul", "source": "mul.asm", "expect": {"result": 44318}}
+#
+# An expected value is a word, a list of consecutive words, or
+# {"equals": <label>, "words": <count>} to compare two blocks.
+#
+# Every benchmark runs on every engine in ENGINES and every bus
+# configuration in CONFIGS, in three passes:
+#   count  - on a bus that counts reads and writes, stepping one
+#            instruction at a time, to find the instruction and bus
+#            operation counts and check the program halts
+#   time   - the engine's own run loop, best of <repeat> runs
+#   memory - one run under tracemalloc for the peak allocation
+#
+# Usage: bench.py [-r <repeat>] [-e <engine,...>] [-k <config,...>]
+#                 [-o <results.json>] [-c <baseline.json>] [name ...]
+# Results saved with -o can be given to a later run with -c to
+# compare instructions per second across commits.
+
+import getopt
+import json
+import os
+import platform
+import subprocess
+import sys
+import time
+import tracemalloc
+
+import packed
+from assembler import Assembler, Lexer
+from bus import Bus
+from console import Console
+from cpu import CPU
+from memory import Memory
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+MANIFEST = os.path.join(HERE, 'bench', 'benchmarks.json')
+RESULTS_FORMAT = 'tiny-t-bench'
+RESULTS_VERSION = 1
+
+# Most instructions the count pass runs before giving up
+BUDGET = 10_000_000
+
+# Engine name -> CPU class
+ENGINES = {
+    'cpu': CPU,
+}
+
+
+class CountingBus(Bus):
+    def __init__(self):
+        super().__init__()
+        self.reads = 0
+        self.writes = 0
+
+    def read(self, address):
+        self.reads += 1
+        return super().read(address)
+
+    def write(self, address, data):
+        self.writes += 1
+        super().write(address, data)
+
+
+def ram_only(bus: Bus):
+    bus.register_handler(Memory(4096, 16))
+
+
+def with_console(bus: Bus):
+    # As the loader builds the machine
+    ram_only(bus)
+    bus.register_handler(Console())
+
+
+def with_tracker(bus: Bus):
+    # As when a MemoryView is open
+    ram_only(bus)
+    Memory.track_writes()
+
+
+# Configuration name -> function that adds devices to the bus
+CONFIGS = {
+    'ram': ram_only,
+    'console': with_console,
+    'tracked': with_tracker,
+}
+
+
+class Benchmark:
+    def __init__(self, spec: dict, directory: str):
+        self.name = spec['name']
+        self.path = os.path.join(directory, spec['source'])
+        self.expect = spec.get('expect', {})
+        with open(self.path, 'r') as ifh:
+            text = ifh.read()
+        asm = Assembler(Lexer(), text, self.path)
+        asm.collect()
+        self.segments = packed.segments(asm.words())
+        self.symbols = asm.symbol_table
+
+    def machine(self, engine: str, config: str, bus: Bus = None) -> CPU:
+        # A fresh machine with the program loaded
+        Memory.trackers.clear()
+        bus = bus or Bus()
+        CONFIGS[config](bus)
+        ram = bus.handlers[0]
+        for start, run in self.segments:
+            ram.write_block(start, run.tolist())
+        return ENGINES[engine](bus)
+
+    def check(self) -> list[str]:
+        failures = []
+        mem = Memory.mem
+        for label, expected in self.expect.items():
+            address = self.symbols[label]
+            if isinstance(expected, dict):
+                count = expected['words']
+                other = self.symbols[expected['equals']]
+                expected = mem[other:other + count]
+            elif not isinstance(expected, list):
+                expected = [expected]
+            found = mem[address:address + len(expected)]
+            if found != expected:
+                failures.append(f'{label} expected {expected} got {found}')
+        return failures
+
+
+def count_pass(benchmark: Benchmark, engine: str, config: str) -> tuple[int, int]:
+    # Returns (instructions, bus operations)
+    bus = CountingBus()
+    cpu = benchmark.machine(engine, config, bus)
+    bus.reads = bus.writes = 0
+    step = cpu.step
+    executed = 0
+    while cpu.active:
+        if executed >= BUDGET:
+            raise ValueError(f'{benchmark.name} did not halt within {BUDGET} instructions')
+        step()
+        executed += 1
+    return executed, bus.reads + bus.writes
+
+
+def time_pass(benchmark: Benchmark, engine: str, config: str, repeat: int) -> float:
+    best = None
+    for _ in range(repeat):
+        cpu = benchmark.machine(engine, config)
+        start = time.perf_counter()
+        cpu.run()
+        seconds = time.perf_counter() - start
+        best = seconds if best is None else min(best, seconds)
+    return best
+
+
+def memory_pass(benchmark: Benchmark, engine: str, config: str) -> int:
+    # Peak bytes allocated while building and running the machine
+    tracemalloc.start()
+    try:
+        cpu = benchmark.machine(engine, config)
+        cpu.run()
+        _, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+    return peak
+
+
+def run_benchmark(benchmark: Benchmark, engine: str, config: str, repeat: int) -> dict:
+    instructions, bus_ops = count_pass(benchmark, engine, config)
+    seconds = time_pass(benchmark, engine, config, repeat)
+    failures = benchmark.check()
+    peak = memory_pass(benchmark, engine, config)
+    Memory.trackers.clear()
+    return {
+        'name': benchmark.name,
+        'engine': engine,
+        'config': config,
+        'passed': not failures,
+        'failures': failures,
+        'instructions': instructions,
+        'bus_ops': bus_ops,
+        'seconds': seconds,
+        'instructions_per_second': instructions / seconds,
+        'bus_ops_per_second': bus_ops / seconds,
+        'peak_bytes': peak,
+    }
+
+
+def load_manifest(path: str) -> list[Benchmark]:
+    with open(path, 'r') as ifh:
+        specs = json.load(ifh)
+    directory = os.path.dirname(os.path.abspath(path))
+    return [Benchmark(spec, directory) for spec in specs]
+
+
+def git_commit() -> str:
+    try:
+        result = subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], cwd=HERE,
+                                capture_output=True, text=True, timeout=10)
+    except (OSError, subprocess.SubprocessError):
+        return ''
+    return result.stdout.strip() if result.returncode == 0 else ''
+
+
+def results_document(results: list[dict], repeat: int) -> dict:
+    return {
+        'format': RESULTS_FORMAT,
+        'version': RESULTS_VERSION,
+        'commit': git_commit(),
+        'timestamp': time.strftime('%Y-%m-%dT%H:%M:%S%z'),
+        'python': platform.python_version(),
+        'implementation': platform.python_implementation(),
+        'machine': platform.machine(),
+        'repeat': repeat,
+        'results': results,
+    }
+
+
+def load_baseline(path: str) -> dict:
+    with open(path, 'r') as ifh:
+        data = json.load(ifh)
+    if data.get('format') != RESULTS_FORMAT:
+        raise ValueError(f'Not a Tiny-T benchmark results file: {path}')
+    return {(r['name'], r['engine'], r['config']): r for r in data['results']}
+
+
+def report(result: dict, baseline: dict = None) -> str:
+    status = 'ok' if result['passed'] else 'FAIL'
+    line = (f"{result['name']:<8} {result['engine']:<6} {result['config']:<8} "
+            f"{result['instructions']:>10} {result['instructions_per_second']:>12,.0f} "
+            f"{result['bus_ops_per_second']:>12,.0f} {result['peak_bytes'] / 1024:>9.1f}  {status}")
+    if baseline is not None:
+        old = baseline.get((result['name'], result['engine'], result['config']))
+        if old is not None:
+            line += f"  x{result['instructions_per_second'] / old['instructions_per_second']:.2f}"
+    for failure in result['failures']:
+        line += f'\n    {failure}'
+    return line
+
+
+def main(argv):
+    repeat = 3
+    engines = list(ENGINES)
+    configs = list(CONFIGS)
+    outputfile = ''
+    baselinefile = ''
+    manifest = MANIFEST
+    usage_message = ("Usage: bench.py [-r <repeat>] [-e <engine,...>] [-k <config,...>] "
+                     "[-o <results.json>] [-c <baseline.json>] [-m <manifest>] [name ...]")
+
+    try:
+        opts, args = getopt.getopt(argv, "hr:e:k:o:c:m:",
+                                   ["help", "repeat=", "engines=", "configs=", "ofile=", "compare=", "manifest="])
+    except getopt.GetoptError:
+        print(usage_message)
+        sys.exit(2)
+
+    for opt, arg in opts:
+        if opt in ('-h', '--help'):
+            print(usage_message)
+            sys.exit()
+        elif opt in ('-r', '--repeat'):
+            repeat = max(1, int(arg))
+        elif opt in ('-e', '--engines'):
+            engines = arg.split(',')
+        elif opt in ('-k', '--configs'):
+            configs = arg.split(',')
+        elif opt in ('-o', '--ofile'):
+            outputfile = arg
+        elif opt in ('-c', '--compare'):
+            baselinefile = arg
+        elif opt in ('-m', '--manifest'):
+            manifest = arg
+
+    unknown = [f'engine {name}' for name in engines if name not in ENGINES]
+    unknown += [f'configuration {name}' for name in configs if name not in CONFIGS]
+    if unknown:
+        print(f'Unknown {", ".join(unknown)}')
+        print(usage_message)
+        print(f'Engines: {", ".join(ENGINES)}')
+        print(f'Configurations: {", ".join(CONFIGS)}')
+        sys.exit(2)
+
+    benchmarks = load_manifest(manifest)
+    if args:
+        benchmarks = [benchmark for benchmark in benchmarks if benchmark.name in args]
+    baseline = load_baseline(baselinefile) if baselinefile else None
+
+    print(f"{'name':<8} {'engine':<6} {'config':<8} {'instrs':>10} {'instr/s':>12} {'bus ops/s':>12} {'peak KB':>9}")
+    results = []
+    for benchmark in benchmarks:
+        for engine in engines:
+            for config in configs:
+                result = run_benchmark(benchmark, engine, config, repeat)
+                results.append(result)
+                print(report(result, baseline), flush=True)
+
+    if outputfile:
+        with open(outputfile, 'w') as ofh:
+            json.dump(results_document(results, repeat), ofh, indent=1)
+        print(f'Results written to {outputfile}')
+
+    if not all(result['passed'] for result in results):
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main(sys.argv[1:])
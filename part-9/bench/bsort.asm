@@ -0,0 +1,93 @@
+# Tiny-T Benchmark: bubble sort
+# Copies source to table and sorts table in ascending order, reps
+# times. Tiny-T has no indexed addressing, so each array access is
+# made by an instruction whose operand is patched before it runs:
+# the template instruction (LDA table, STA table...) is loaded,
+# the index added, and the result stored over the access.
+# Values must be below 0x4000 so differences can be tested with BRP.
+
+        ORG. 0x000
+start:  LDA reps
+        STA count
+again:  LDA zero
+        STA i
+copy:   LDA i
+        ADD tpl_ld_src
+        STA c_ld
+        LDA i
+        ADD tpl_st_tab
+        STA c_st
+c_ld:   LDA source
+c_st:   STA table
+        LDA i
+        ADD one
+        STA i
+        SUB n
+        BRZ sort
+        BRA copy
+sort:   LDA n
+        SUB one
+        STA limit
+pass:   LDA zero
+        STA i
+inner:  LDA i
+        ADD tpl_ld_tab
+        STA s_ld0
+        ADD one
+        STA s_ld1
+        LDA i
+        ADD tpl_st_tab
+        STA s_st0
+        ADD one
+        STA s_st1
+s_ld0:  LDA table
+        STA x
+s_ld1:  LDA table
+        STA y
+        LDA x
+        SUB y
+        BRZ noswap
+        BRP swap
+        BRA noswap
+swap:   LDA y
+s_st0:  STA table
+        LDA x
+s_st1:  STA table
+noswap: LDA i
+        ADD one
+        STA i
+        SUB limit
+        BRZ endpass
+        BRA inner
+endpass: LDA limit
+        SUB one
+        STA limit
+        BRZ sorted
+        BRA pass
+sorted: LDA count
+        SUB one
+        STA count
+        BRZ done
+        BRA again
+done:   HTL
+
+# Templates: never executed, only loaded and patched
+tpl_ld_src: LDA source
+tpl_ld_tab: LDA table
+tpl_st_tab: STA table
+
+reps:   DW. 20
+n:      DW. 24
+zero:   DW. 0
+one:    DW. 1
+count:  DW. 0
+limit:  DW. 0
+i:      DW. 0
+x:      DW. 0
+y:      DW. 0
+
+        ORG. 0x200
+source: DW. 9034, 1521, 15999, 44, 7310, 12001, 3, 8192
+        DW. 2750, 16000, 611, 9034, 5005, 14321, 230, 7777
+        DW. 4096, 10, 13370, 2048, 999, 11111, 6502, 380
+table:  DS. 24
@@ -0,0 +1,103 @@
+# Tiny-T Benchmark: CRC-16/CCITT-FALSE (polynomial 0x1021, initial
+# value 0xFFFF) of a message, reps times. DB. packs two bytes per
+# word, high byte first. The high byte is already in place for the
+# XOR into the CRC; the low byte is moved up by adding it to itself
+# eight times. Shifting the CRC left is also done by adding.
+
+        ORG. 0x000
+start:  LDA reps
+        STA count
+again:  LDA init
+        STA crc
+        LDA zero
+        STA i
+word:   LDA i
+        ADD tpl_ld_msg
+        STA w_ld
+w_ld:   LDA message
+        STA w
+        AND hi_mask
+        STA v
+        LDA one
+        STA half
+mix:    LDA v
+        XOR crc
+        STA crc
+        LDA eight
+        STA bits
+bit:    LDA crc
+        AND msb
+        BRZ shift
+        LDA crc
+        ADD crc
+        XOR poly
+        STA crc
+        BRA nextbit
+shift:  LDA crc
+        ADD crc
+        STA crc
+nextbit: LDA bits
+        SUB one
+        STA bits
+        BRZ bytedone
+        BRA bit
+bytedone: LDA half
+        BRZ nextword
+        LDA zero
+        STA half
+        LDA w
+        AND lo_mask
+        STA v
+        ADD v
+        STA v
+        ADD v
+        STA v
+        ADD v
+        STA v
+        ADD v
+        STA v
+        ADD v
+        STA v
+        ADD v
+        STA v
+        ADD v
+        STA v
+        ADD v
+        STA v
+        BRA mix
+nextword: LDA i
+        ADD one
+        STA i
+        SUB words
+        BRZ round
+        BRA word
+round:  LDA count
+        SUB one
+        STA count
+        BRZ done
+        BRA again
+done:   HTL
+
+# Template: never executed, only loaded and patched
+tpl_ld_msg: LDA message
+
+reps:   DW. 20
+words:  DW. 22
+init:   DW. 0xFFFF
+poly:   DW. 0x1021
+msb:    DW. 0x8000
+hi_mask: DW. 0xFF00
+lo_mask: DW. 0x00FF
+zero:   DW. 0
+one:    DW. 1
+eight:  DW. 8
+count:  DW. 0
+crc:    DW. 0
+i:      DW. 0
+w:      DW. 0
+v:      DW. 0
+half:   DW. 0
+bits:   DW. 0
+
+        ORG. 0x200
+message: DB. "The quick brown fox jumps over the lazy dog."
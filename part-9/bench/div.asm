@@ -0,0 +1,62 @@
+# Tiny-T Benchmark: division by shift and subtract
+# quot, rem = dividend / divisor (unsigned), computed reps times.
+# The divisor must be below 0x8000 so that the sign of rem - divisor
+# can be tested with BRP.
+
+        ORG. 0x000
+start:  LDA reps
+        STA count
+outer:  LDA zero
+        STA quot
+        STA rem
+        LDA dividend
+        STA n
+        LDA sixteen
+        STA bits
+step:   LDA rem
+        ADD rem
+        STA rem
+        LDA n
+        AND msb
+        BRZ nobit
+        LDA rem
+        ADD one
+        STA rem
+nobit:  LDA n
+        ADD n
+        STA n
+        LDA quot
+        ADD quot
+        STA quot
+        LDA rem
+        SUB divisor
+        BRP fits
+        BRA next
+fits:   STA rem
+        LDA quot
+        ADD one
+        STA quot
+next:   LDA bits
+        SUB one
+        STA bits
+        BRZ round
+        BRA step
+round:  LDA count
+        SUB one
+        STA count
+        BRZ done
+        BRA outer
+done:   HTL
+
+reps:   DW. 300
+dividend: DW. 54321
+divisor: DW. 123
+zero:   DW. 0
+one:    DW. 1
+sixteen: DW. 16
+msb:    DW. 0x8000
+count:  DW. 0
+quot:   DW. 0
+rem:    DW. 0
+n:      DW. 0
+bits:   DW. 0
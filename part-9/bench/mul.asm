@@ -0,0 +1,52 @@
+# Tiny-T Benchmark: multiply by shift and add
+# result = a * b (low 16 bits), computed reps times.
+# Bit i of b is tested with a mask that doubles each step, and
+# the addend is a shifted left by i (doubled by adding it to
+# itself).
+
+        ORG. 0x000
+start:  LDA reps
+        STA count
+outer:  LDA zero
+        STA result
+        LDA a
+        STA addend
+        LDA one
+        STA mask
+        LDA sixteen
+        STA bits
+bit:    LDA b
+        AND mask
+        BRZ skip
+        LDA result
+        ADD addend
+        STA result
+skip:   LDA addend
+        ADD addend
+        STA addend
+        LDA mask
+        ADD mask
+        STA mask
+        LDA bits
+        SUB one
+        STA bits
+        BRZ next
+        BRA bit
+next:   LDA count
+        SUB one
+        STA count
+        BRZ done
+        BRA outer
+done:   HTL
+
+reps:   DW. 400
+a:      DW. 1234
+b:      DW. 567
+zero:   DW. 0
+one:    DW. 1
+sixteen: DW. 16
+count:  DW. 0
+result: DW. 0
+addend: DW. 0
+mask:   DW. 0
+bits:   DW. 0
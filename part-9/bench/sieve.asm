@@ -0,0 +1,78 @@
+# Tiny-T Benchmark: sieve of Eratosthenes
+# Counts the primes below n, reps times. flags[i] is set to 1 when
+# i is found to be a multiple of a smaller prime. Array accesses
+# are made by patched instructions (see bsort.asm).
+
+        ORG. 0x000
+start:  LDA reps
+        STA count
+again:  LDA zero
+        STA i
+clear:  LDA i
+        ADD tpl_st_flags
+        STA c_st
+        LDA zero
+c_st:   STA flags
+        LDA i
+        ADD one
+        STA i
+        SUB n
+        BRZ sieve
+        BRA clear
+sieve:  LDA zero
+        STA primes
+        LDA two
+        STA i
+test:   LDA i
+        ADD tpl_ld_flags
+        STA t_ld
+t_ld:   LDA flags
+        BRZ prime
+        BRA nexti
+prime:  LDA primes
+        ADD one
+        STA primes
+        LDA i
+        ADD i
+        STA j
+mark:   LDA j
+        SUB n
+        BRP nexti
+        LDA j
+        ADD tpl_st_flags
+        STA m_st
+        LDA one
+m_st:   STA flags
+        LDA j
+        ADD i
+        STA j
+        BRA mark
+nexti:  LDA i
+        ADD one
+        STA i
+        SUB n
+        BRZ counted
+        BRA test
+counted: LDA count
+        SUB one
+        STA count
+        BRZ done
+        BRA again
+done:   HTL
+
+# Templates: never executed, only loaded and patched
+tpl_ld_flags: LDA flags
+tpl_st_flags: STA flags
+
+reps:   DW. 10
+n:      DW. 400
+zero:   DW. 0
+one:    DW. 1
+two:    DW. 2
+count:  DW. 0
+primes: DW. 0
+i:      DW. 0
+j:      DW. 0
+
+        ORG. 0x200
+flags:  DS. 400
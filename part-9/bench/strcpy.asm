@@ -0,0 +1,46 @@
+# Tiny-T Benchmark: string copy
+# Copies the zero terminated string at source to dest, reps times.
+# DB. packs two characters per word and the string ends with a
+# whole zero word. Array accesses are made by patched instructions
+# (see bsort.asm).
+
+        ORG. 0x000
+start:  LDA reps
+        STA count
+again:  LDA zero
+        STA i
+copy:   LDA i
+        ADD tpl_ld_src
+        STA c_ld
+        LDA i
+        ADD tpl_st_dst
+        STA c_st
+c_ld:   LDA source
+c_st:   STA dest
+        BRZ copied
+        LDA i
+        ADD one
+        STA i
+        BRA copy
+copied: LDA count
+        SUB one
+        STA count
+        BRZ done
+        BRA again
+done:   HTL
+
+# Templates: never executed, only loaded and patched
+tpl_ld_src: LDA source
+tpl_st_dst: STA dest
+
+reps:   DW. 150
+zero:   DW. 0
+one:    DW. 1
+count:  DW. 0
+i:      DW. 0
+
+        ORG. 0x200
+source: DB. "Tiny-T is a simple CPU Simulator intended as a teaching aid "
+        DB. "for students learning about computer architecture.", 0, 0
+        ORG. 0x300
+dest:   DS. 64
@@ -0,0 +1,192 @@
+#!/usr/bin/python3
+# -*- coding: utf-8 -*-
+# File: cfg.py
+""" Tiny-T Control Flow Graph
+Tiny-T is a simple CPU Simulator intended as a teaching aid for students
+learning about computer architecture.
+This program is free software: you can redistribute it and/or modify it under
+the terms of the GNU General Public License as published by the Free Software
+Foundation, either version 2 of the License, or (at your option) any later
+version.
+This program is distributed in the hope that it will be useful, but WITHOUT
+ANY WARRANTY; without even the implied warranty of MERCHANTABILITY or FITNESS
+FOR A PARTICULAR PURPOSE. See the GNU General Public License for more details.
+You should have received a copy of the GNU General Public License along with
+this program. If not, see <http://www.gnu.org/licenses/>.
+"""
+
+__author__ = "Randall Morgan"
+__contact__ = "rmorgan@coderancher.us"
+__copyright__ = "Copyright 2022, SensorNet"
+__credits__ = ["Randall Morgan", "SensorNet.Us"]
+__date__ = "2022/05/23"
+__deprecated__ = False
+__email__ = "rmorgan@coderancher.us"
+__license__ = "GPLv2 or Later"
+__maintainer__ = "Randall Morgan"
+__status__ = "Production"
+__version__ = "1.0.0"
+
+# The control flow graph of an image is found by recursive
+# traversal: starting at the entry points, instructions are
+# decoded one after another, BRA/BRP/BRZ targets are queued as
+# new starting points, and a path stops at HTL, at BRA, or when it
+# runs off the end of the image. Every word that is reached is
+# code. Everything else is data.
+#
+# Code is split into basic blocks. A block starts at an entry
+# point, at a branch target, or after a conditional branch, and
+# ends with the last word before the next start, or with a HTL
+# or branch. Each block lists the blocks control may pass to next
+# (successors) and the blocks that may pass control to it
+# (predecessors).
+#
+# The operands of LDA, STA, ADD, SUB, AND, OR and XOR are recorded
+# as data references. INP and OUT operands are port numbers, not
+# addresses. Words the program computes or modifies at run time
+# (self-modifying code, computed tables) can not be seen by a
+# static traversal.
+
+from isa import TINY_T
+
+HLT, BRA, BRP, BRZ = 0x0, 0xB, 0xC, 0xD
+
+# Instructions whose operand is a memory address
+MEMORY_ACCESS = {0x1, 0x2, 0x3, 0x4, 0x5, 0x6, 0x7}
+BRANCHES = {BRA, BRP, BRZ}
+
+# Instructions after which control never falls through
+TERMINATORS = {HLT, BRA}
+
+
+class BasicBlock:
+    def __init__(self, start: int):
+        self.start = start
+        # Address after the last word of the block
+        self.end = start
+        self.successors = []
+        self.predecessors = []
+
+    @property
+    def size(self) -> int:
+        return self.end - self.start
+
+    @property
+    def last(self) -> int:
+        # Address of the block's final instruction
+        return self.end - 1
+
+    def __contains__(self, address: int) -> bool:
+        return self.start <= address < self.end
+
+    def __repr__(self) -> str:
+        return f'BasicBlock({self.start:#05x}-{self.last:#05x})'
+
+
+class ControlFlowGraph:
+    def __init__(self, image: dict, entries=(0,), isa=TINY_T):
+        """ image maps addresses to machine words. entries are the
+        addresses execution may start at; the CPU starts at 0.
+        """
+        self.image = image
+        self.isa = isa
+        self.entries = sorted(set(entries))
+        # Addresses of the words reached as instructions
+        self.code = set()
+        self.branch_targets = set()
+        self.data_refs = set()
+        # Branch targets and fall throughs outside the image
+        self.missing = set()
+        # Block start address -> BasicBlock
+        self.blocks = {}
+        self._block_of = {}
+        self.build()
+
+    def instruction(self, address: int) -> tuple[int, int]:
+        return self.isa.decode(self.image[address])
+
+    def build(self):
+        image = self.image
+        code = self.code
+        leaders = set(self.entries)
+        pending = list(self.entries)
+        while pending:
+            address = pending.pop()
+            while address not in code:
+                if address not in image:
+                    self.missing.add(address)
+                    break
+                code.add(address)
+                opcode, operand = self.instruction(address)
+                if opcode in MEMORY_ACCESS:
+                    self.data_refs.add(operand)
+                elif opcode in BRANCHES:
+                    self.branch_targets.add(operand)
+                    leaders.add(operand)
+                    pending.append(operand)
+                    if opcode != BRA:
+                        leaders.add(address + 1)
+                if opcode in TERMINATORS:
+                    break
+                address += 1
+
+        # Lay out the blocks, then link them
+        for leader in sorted(leaders & code):
+            block = BasicBlock(leader)
+            address = leader
+            while True:
+                self._block_of[address] = block
+                opcode, _ = self.instruction(address)
+                address += 1
+                if opcode in TERMINATORS or opcode in BRANCHES or address in leaders or address not in code:
+                    break
+            block.end = address
+            self.blocks[leader] = block
+
+        for block in self.blocks.values():
+            for target in self.exits(block):
+                successor = self.blocks.get(target)
+                if successor is not None:
+                    block.successors.append(successor)
+                    successor.predecessors.append(block)
+
+    def exits(self, block: BasicBlock) -> list[int]:
+        # Addresses control may pass to after the block: the branch
+        # target first, then the fall through.
+        opcode, operand = self.instruction(block.last)
+        if opcode == HLT:
+            return []
+        elif opcode == BRA:
+            return [operand]
+        elif opcode in BRANCHES:
+            return [operand, block.end] if operand != block.end else [operand]
+        return [block.end]
+
+    def block_at(self, address: int):
+        # The block containing address, or None for data
+        return self._block_of.get(address)
+
+    def instructions(self, block: BasicBlock):
+        # (address, opcode, operand) for each word of the block
+        for address in range(block.start, block.end):
+            yield (address, *self.instruction(address))
+
+    def data(self) -> list[int]:
+        # Addresses of the image words never reached as code
+        return sorted(set(self.image) - self.code)
+
+    def reachable(self, start: int = None) -> list[BasicBlock]:
+        # Blocks reachable from start (default: every entry point)
+        # in depth first order.
+        starts = self.entries if start is None else [start]
+        seen = set()
+        order = []
+        stack = [self.blocks[address] for address in reversed(starts) if address in self.blocks]
+        while stack:
+            block = stack.pop()
+            if block.start in seen:
+                continue
+            seen.add(block.start)
+            order.append(block)
+            stack.extend(reversed(block.successors))
+        return order
@@ -26,8 +26,19 @@ __maintainer__ = "Randall Morgan"
 __status__ = "Production"
 __version__ = "1.0.0"
 
+import time
+
 from bus import Bus
 
+# Throttled run: supported clock rates, the length of a burst of
+# instructions between sleeps, and how far behind the clock may
+# fall (after a pause in a debugger, say) before it is reset
+# rather than caught up with a fast burst.
+MIN_FREQUENCY = 1
+MAX_FREQUENCY = 100_000
+BURST_TIME = 0.01
+MAX_LAG = 0.25
+
 
 class CPU:
 
@@ -40,6 +51,9 @@ class CPU:
         self.p_flag = 0
         self.bus = bus
         self.active = True
+        # Clock rates of the last run_throttled(), 0.0 before one
+        self.target_frequency = 0.0
+        self.achieved_frequency = 0.0
 
     def set_accumulator(self, value):
         # Set Zero flag
@@ -84,7 +98,48 @@ class CPU:
     def run(self):
         while self.active:
             self.step()
-            # time.sleep(0.02)
+
+    def run_throttled(self, frequency: float, steps: int = None) -> dict:
+        """ Run at a steady clock rate until halted, or until steps
+        instructions have run.
+        Instructions run in bursts of about BURST_TIME seconds, then
+        the CPU sleeps until the time the burst should end at the
+        target rate. Deadlines are measured from the start of the
+        run, so sleep errors do not add up to drift. Returns the
+        target and achieved frequency in Hz.
+        """
+        if not MIN_FREQUENCY <= frequency <= MAX_FREQUENCY:
+            raise ValueError(f"Clock rate out of range {MIN_FREQUENCY} - {MAX_FREQUENCY} Hz: {frequency}")
+        burst = max(1, int(frequency * BURST_TIME))
+        period = 1 / frequency
+        self.target_frequency = frequency
+        self.achieved_frequency = 0.0
+
+        step = self.step
+        executed = 0
+        start = clock = time.perf_counter()
+        while self.active and (steps is None or executed < steps):
+            count = burst if steps is None else min(burst, steps - executed)
+            for _ in range(count):
+                step()
+                executed += 1
+                if not self.active:
+                    break
+            now = time.perf_counter()
+            delay = clock + executed * period - now
+            if delay > 0:
+                time.sleep(delay)
+            elif delay < -MAX_LAG:
+                # Too far behind to catch up, so restart the clock
+                clock = now - executed * period
+            self.achieved_frequency = executed / (time.perf_counter() - start)
+
+        return {
+            'target_hz': frequency,
+            'achieved_hz': self.achieved_frequency,
+            'instructions': executed,
+            'seconds': time.perf_counter() - start,
+        }
 
     def execute(self, opcode, operand):
         match (opcode):
@@ -25,7 +25,7 @@ __email__ = "rmorgan@coderancher.us"
 __license__ = "GPLv2 or Later"
 __maintainer__ = "Randall Morgan"
 __status__ = "Production"
-__version__ = "1.0.0"
+__version__ = "1.3.0"
 
 # Tiny-T CPU Instructions
 # OPCODE | Mnemonic | Description
@@ -47,27 +47,86 @@ __version__ = "1.0.0"
 # E0pp | INP pp    | ACC <- I/O port[pp]
 # F0pp | OUT pp    | I/O port[pp] <- ACC
 #
+# Input may be a text (.bin) or packed (.tbin) image. Text input
+# is disassembled as a stream of lines, so multi-megabyte images
+# and traces run in constant memory.
+#
+# With -r (or -e <entry,...>) the image is disassembled by
+# following control flow from the entry points (see cfg.py), and
+# the output is source the assembler accepts.
 
 import getopt
 import sys
+from itertools import islice
+
+import packed
+from cfg import BRANCHES, MEMORY_ACCESS, ControlFlowGraph
+from memory import Memory
+from srcmap import SourceMap
+
+# Lines written to the output file at a time
+CHUNK_LINES = 4096
+
+# Width of the label column in recursive disassembly
+LABEL_WIDTH = 10
 
 
 class Disassembler:
+    # Rendered text of every word seen so far, indexed by the word.
+    # Each of the 65536 words is formatted at most once.
+    TEXT = [None] * 0x10000
+
+    @staticmethod
+    def disasm(program_code: str, source_map=None):
+        # Disassemble each line. With a source map, labels are
+        # written above the words they name.
+        return ''.join(Disassembler.lines(program_code.split('\n'), source_map))
+
+    @staticmethod
+    def words(lines):
+        # (address text, word) for each line of a text image.
+        # Blank lines are skipped.
+        for line in lines:
+            fields = line.split()
+            if fields:
+                addr, word = fields
+                yield addr, int(word)
+
+    @staticmethod
+    def lines(lines, source_map=None):
+        """ Yield the disassembly of a text image one line at a
+        time. lines may be any iterable of lines, such as an open
+        file, so memory use does not grow with the image.
+        """
+        return Disassembler.render(Disassembler.words(lines), source_map)
+
     @staticmethod
-    def disasm(program_code: str):
-        # Disassemble each line
-        asm_text = ''
-        for line in program_code.split('\n'):
-            # split the address and instruction
-            if line:
-                addr, word = line.split()
-                asm_text += f'{addr}\t\t' + Disassembler.decode(word) + '\n'
-        return asm_text
+    def render(words, source_map=None):
+        # Yield the disassembly of (address, word) pairs. The
+        # address is written as given.
+        text = Disassembler.TEXT
+        labels = source_map.labels() if source_map is not None else {}
+        for addr, word in words:
+            rendered = text[word]
+            if rendered is None:
+                rendered = text[word] = Disassembler.decode(word) + '\n'
+            if labels:
+                label = labels.get(int(addr))
+                if label is not None:
+                    yield f'{label}:\n'
+            yield f'{addr}\t\t{rendered}'
+
+    @staticmethod
+    def text(word: int) -> str:
+        # Cached rendering of a word, with a trailing newline
+        rendered = Disassembler.TEXT[word]
+        if rendered is None:
+            rendered = Disassembler.TEXT[word] = Disassembler.decode(word) + '\n'
+        return rendered
 
     @staticmethod
     def decode(val: int) -> str:
         val = int(val)
-        text = ''
         opcode = (val & 0xF000) >> 12
         operand = (val & 0x0FFF)
         mnemonic = Disassembler.INSTR[opcode].upper()
@@ -93,13 +152,190 @@ class Disassembler:
     ]
 
 
+class RecursiveDisassembler:
+    """ Disassemble an image by following control flow from its
+    entry points. The output is assembler source: words reached as
+    code are written as instructions, other words as DW. data, and
+    branch targets and load/store operands are given labels, so
+    assembling the output gives back the same image.
+    """
+
+    def __init__(self, image: dict, entries=(0,), source_map=None):
+        self.cfg = ControlFlowGraph(image, entries)
+        self.labels = self.make_labels(source_map)
+
+    def make_labels(self, source_map=None) -> dict:
+        # Address -> label. Names from a source map are used where
+        # there is one, otherwise loc_xxx for branch targets and
+        # dat_xxx for data references.
+        cfg = self.cfg
+        names = source_map.labels() if source_map is not None else {}
+        labels = {}
+        for address in sorted(cfg.data_refs | cfg.branch_targets):
+            prefix = 'loc' if address in cfg.branch_targets else 'dat'
+            labels[address] = names.get(address, f'{prefix}_{address:03x}')
+        for address, name in names.items():
+            if address in cfg.image:
+                labels.setdefault(address, name)
+        return labels
+
+    def operand_text(self, opcode: int, operand: int) -> str:
+        if opcode in MEMORY_ACCESS or opcode in BRANCHES:
+            label = self.labels.get(operand)
+            if label is not None:
+                return f' {label}'
+        elif not operand and opcode in (0x0, 0x8, 0x9, 0xA):
+            return ''
+        return f' 0x{operand:03X}'
+
+    def statement(self, address: int) -> str:
+        word = self.cfg.image[address]
+        if address in self.cfg.code:
+            opcode, operand = self.cfg.instruction(address)
+            mnemonic = Disassembler.INSTR[opcode].upper()
+            return mnemonic + self.operand_text(opcode, operand)
+        return f'DW. 0x{word:04X}'
+
+    def line(self, label, text: str, comment: str = '') -> str:
+        field = f'{label}:' if label else ''
+        if len(field) >= LABEL_WIDTH:
+            field += '\n' + ' ' * LABEL_WIDTH
+        else:
+            field = f'{field:<{LABEL_WIDTH}}'
+        if comment:
+            text = f'{text:<24}# {comment}'
+        return f'{field}{text}\n'
+
+    def lines(self):
+        # Yield the source one line at a time
+        cfg = self.cfg
+        entries = ', '.join(f'0x{address:03X}' for address in cfg.entries)
+        yield f'# Recursive disassembly from entry points {entries}\n'
+
+        # Labelled addresses outside the image become constants
+        outside = [address for address in self.labels if address not in cfg.image]
+        for address in outside:
+            yield self.line(self.labels[address], f'EQU. 0x{address:03X}')
+
+        previous = None
+        for address in sorted(cfg.image):
+            if previous is None or address != previous + 1:
+                yield '\n'
+                yield self.line(None, f'ORG. 0x{address:03X}')
+            previous = address
+            label = self.labels.get(address)
+            if address in cfg.code:
+                comment = f'{address:03X}'
+            else:
+                comment = f'{address:03X} data'
+            yield self.line(label, self.statement(address), comment)
+
+    def source(self) -> str:
+        return ''.join(self.lines())
+
+
+class MemoryView:
+    """ A disassembly of a window of a running machine's Memory.
+    Rendered lines are kept per address. refresh() re-renders only
+    the addresses written since the last refresh, so redrawing a 4K
+    view after a few stores costs a few lines.
+    """
+
+    def __init__(self, memory: Memory, start: int = 0, count: int = None, source_map=None):
+        self.memory = memory
+        self.start = start
+        self.end = start + (memory.size if count is None else count)
+        self.labels = source_map.labels() if source_map is not None else {}
+        self.rendered = [None] * (self.end - self.start)
+        self.tracker = memory.track_writes()
+
+    def render(self, address: int) -> str:
+        mem = Memory.mem
+        word = mem[address] if address < len(mem) else 0
+        return f'{address:04d}\t\t{Disassembler.text(word)}'
+
+    def line(self, address: int) -> str:
+        index = address - self.start
+        rendered = self.rendered[index]
+        if rendered is None:
+            rendered = self.rendered[index] = self.render(address)
+        return rendered
+
+    def label(self, address: int):
+        return self.labels.get(address)
+
+    def refresh(self) -> list[int]:
+        # Drop the lines written since the last refresh. Returns the
+        # addresses in the window whose lines changed.
+        changed = []
+        for start, end in self.tracker.take():
+            start = max(start, self.start)
+            end = min(end, self.end)
+            for address in range(start, end):
+                index = address - self.start
+                old = self.rendered[index]
+                if old is not None:
+                    new = self.render(address)
+                    if new == old:
+                        continue
+                    self.rendered[index] = new
+                changed.append(address)
+        return changed
+
+    def lines(self, start: int = None, end: int = None):
+        # Yield the lines of addresses start up to end, with the
+        # labels of a source map above the words they name
+        start = self.start if start is None else max(start, self.start)
+        end = self.end if end is None else min(end, self.end)
+        for address in range(start, end):
+            label = self.labels.get(address)
+            if label is not None:
+                yield f'{label}:\n'
+            yield self.line(address)
+
+    def text(self, start: int = None, end: int = None) -> str:
+        return ''.join(self.lines(start, end))
+
+    def close(self):
+        # Stop tracking writes
+        self.memory.untrack_writes(self.tracker)
+
+
+def write_chunks(ofh, lines) -> int:
+    # Write lines to ofh CHUNK_LINES at a time. Returns the
+    # number of characters written.
+    written = 0
+    while True:
+        chunk = ''.join(islice(lines, CHUNK_LINES))
+        if not chunk:
+            return written
+        written += ofh.write(chunk)
+
+
+def parse_entries(text: str) -> list[int]:
+    # Entry points given as a comma separated list of numbers
+    try:
+        return [int(item, 0) for item in text.split(',') if item.strip()]
+    except ValueError:
+        raise ValueError(f'Illegal entry point list: {text}')
+
+
+def packed_words(data):
+    # (address text, word) for each word of a packed image
+    for start, run in packed.unpack(data):
+        for addr, word in enumerate(run, start):
+            yield f'{addr:04d}', word
+
+
 def main(argv):
     inputfile = ''
     outputfile = ''
-    usage_message = "Usage: assembler.py -i <inputfile> -o <outputfile>"
+    mapfile = ''
+    entries = None
+    usage_message = "Usage: disassembler.py [-r] [-e <entry,...>] [-m <mapfile>] -i <inputfile> -o <outputfile>"
 
     try:
-        opts, args = getopt.getopt(argv, "hi:0:", ["help", "ifile=", "ofile="])
+        opts, args = getopt.getopt(argv, "hre:m:i:o:", ["help", "recursive", "entries=", "map=", "ifile=", "ofile="])
     except getopt.GetoptError:
         print(usage_message)
         sys.exit(2)
@@ -112,6 +348,12 @@ def main(argv):
             inputfile = arg
         elif opt in ('-o', '--ofile'):
             outputfile = arg
+        elif opt in ('-m', '--map'):
+            mapfile = arg
+        elif opt in ('-r', '--recursive'):
+            entries = entries or [0]
+        elif opt in ('-e', '--entries'):
+            entries = parse_entries(arg)
 
     if not inputfile:
         print(usage_message)
@@ -121,19 +363,28 @@ def main(argv):
     if inputfile and not outputfile:
         outputfile = inputfile.split('.')[0] + '.asm_'
 
-    with open(inputfile, 'r') as ifh:
-        program_code = ifh.read()
-    ifh.close()
+    source_map = None
+    if mapfile:
+        source_map = SourceMap.load(mapfile)
 
-    # Disassemble each line
-    asm_text = Disassembler.disasm(program_code)
+    # Disassemble each line. Text images are read and written a
+    # chunk at a time, so large images and traces need little memory.
+    with open(inputfile, 'rb') as ifh:
+        is_packed = packed.is_packed(ifh.read(len(packed.MAGIC)))
+    with open(inputfile, 'rb' if is_packed else 'r') as ifh, open(outputfile, 'w') as ofh:
+        if is_packed:
+            words = packed_words(ifh.read())
+        else:
+            words = Disassembler.words(ifh)
+        if entries is not None:
+            # Recursive traversal needs the whole image
+            image = {int(addr): word for addr, word in words}
+            lines = RecursiveDisassembler(image, entries, source_map).lines()
+        else:
+            lines = Disassembler.render(words, source_map)
+        written = write_chunks(ofh, lines)
 
-    # Write output file
-    if asm_text:
-        with open(outputfile, 'w') as ofh:
-            ofh.write(asm_text)
-        ofh.close()
-    else:
+    if not written:
         msg = f'Unable to disassemble input file {inputfile}'
         raise AssertionError(msg)
 
@@ -0,0 +1,227 @@
+#!/usr/bin/python3
+# -*- coding: utf-8 -*-
+# File: hexfile.py
+""" Tiny-T Intel HEX and Motorola S-record Images
+Tiny-T is a simple CPU Simulator intended as a teaching aid for students
+learning about computer architecture.
+This program is free software: you can redistribute it and/or modify it under
+the terms of the GNU General Public License as published by the Free Software
+Foundation, either version 2 of the License, or (at your option) any later
+version.
+This program is distributed in the hope that it will be useful, but WITHOUT
+ANY WARRANTY; without even the implied warranty of MERCHANTABILITY or FITNESS
+FOR A PARTICULAR PURPOSE. See the GNU General Public License for more details.
+You should have received a copy of the GNU General Public License along with
+this program. If not, see <http://www.gnu.org/licenses/>.
+"""
+
+__author__ = "Randall Morgan"
+__contact__ = "rmorgan@coderancher.us"
+__copyright__ = "Copyright 2022, SensorNet"
+__credits__ = ["Randall Morgan", "SensorNet.Us"]
+__date__ = "2022/05/23"
+__deprecated__ = False
+__email__ = "rmorgan@coderancher.us"
+__license__ = "GPLv2 or Later"
+__maintainer__ = "Randall Morgan"
+__status__ = "Production"
+__version__ = "1.0.0"
+
+# Intel HEX and Motorola S-record files hold bytes at byte
+# addresses. A Tiny-T word at address a is written as two bytes,
+# high byte first, at byte addresses 2a and 2a + 1, the same
+# order DB. packs bytes into words.
+#
+# Intel HEX records                 S-records
+# :LLAAAATT<data>CC                 STLL<address><data>CC
+# 00 data                           S0 header
+# 01 end of file                    S1/S2/S3 data, 16/24/32 bit address
+# 02 extended segment address       S5/S6 record count
+# 04 extended linear address        S7/S8/S9 end, 32/24/16 bit address
+#
+# Writers split the image into records of at most RECORD_SIZE
+# bytes and start a new record at every gap, so sparse images
+# stay sparse. Readers check every record's checksum and yield
+# runs of consecutive words as soon as a gap ends them, so a
+# file is read and loaded in one pass without holding its lines.
+
+import sys
+from array import array
+
+import packed
+
+HEX_EXTENSION = '.hex'
+SREC_EXTENSION = '.srec'
+RECORD_SIZE = 16
+
+
+def checksum(data) -> int:
+    # Two's complement of the byte sum, used by Intel HEX
+    return -sum(data) & 0xFF
+
+
+def record_bytes(words) -> bytes:
+    words = array('H', words)
+    if sys.byteorder == 'little':
+        words.byteswap()
+    return words.tobytes()
+
+
+def ihex_record(record_type: int, address: int, data: bytes = b'') -> str:
+    fields = bytes([len(data), address >> 8, address & 0xFF, record_type]) + data
+    return f':{fields.hex().upper()}{checksum(fields):02X}\n'
+
+
+def srec_record(record_type: int, address: int, data: bytes = b'', address_size: int = 2) -> str:
+    fields = bytes([address_size + len(data) + 1]) + address.to_bytes(address_size, 'big') + data
+    return f'S{record_type}{fields.hex().upper()}{~sum(fields) & 0xFF:02X}\n'
+
+
+def data_records(words):
+    # (byte address, data) for each record of the image
+    for start, run in packed.segments(words):
+        data = record_bytes(run)
+        for offset in range(0, len(data), RECORD_SIZE):
+            yield 2 * start + offset, data[offset:offset + RECORD_SIZE]
+
+
+def to_ihex(words) -> str:
+    lines = []
+    upper = 0
+    for address, data in data_records(words):
+        if address >> 16 != upper:
+            upper = address >> 16
+            lines.append(ihex_record(0x04, 0, upper.to_bytes(2, 'big')))
+        lines.append(ihex_record(0x00, address & 0xFFFF, data))
+    lines.append(ihex_record(0x01, 0))
+    return ''.join(lines)
+
+
+def to_srec(words, header: str = 'tiny-t') -> str:
+    lines = [srec_record(0, 0, header.encode())]
+    count = 0
+    for address, data in data_records(words):
+        if address > 0xFFFF:
+            raise ValueError('S-record images are limited to 16 bit byte addresses')
+        lines.append(srec_record(1, address, data))
+        count += 1
+    if count <= 0xFFFF:
+        lines.append(srec_record(5, count))
+    lines.append(srec_record(9, 0))
+    return ''.join(lines)
+
+
+def parse_record(line: str, number: int) -> bytes:
+    # The bytes of a record after its type, checked for length
+    try:
+        fields = bytes.fromhex(line)
+    except ValueError:
+        raise ValueError(f'Line {number}: malformed record')
+    if not fields:
+        raise ValueError(f'Line {number}: empty record')
+    return fields
+
+
+def ihex_data(lines):
+    """ Yield (byte address, data) for the data records of an
+    Intel HEX file, given its lines. Stops at the end of file
+    record.
+    """
+    base = 0
+    for number, line in enumerate(lines, 1):
+        line = line.strip()
+        if not line:
+            continue
+        if line[0] != ':':
+            raise ValueError(f'Line {number}: Intel HEX records start with ":"')
+        fields = parse_record(line[1:], number)
+        if len(fields) < 5 or len(fields) != fields[0] + 5:
+            raise ValueError(f'Line {number}: record length does not match its byte count')
+        if sum(fields) & 0xFF:
+            raise ValueError(f'Line {number}: checksum error')
+
+        record_type = fields[3]
+        address = (fields[1] << 8) | fields[2]
+        data = fields[4:-1]
+        if record_type == 0x00:
+            yield base + address, data
+        elif record_type == 0x01:
+            return
+        elif record_type == 0x02:
+            base = int.from_bytes(data, 'big') << 4
+        elif record_type == 0x04:
+            base = int.from_bytes(data, 'big') << 16
+        # Start address records (03 and 05) mean nothing to Tiny-T
+    raise ValueError('Intel HEX file has no end of file record')
+
+
+def srec_data(lines):
+    """ Yield (byte address, data) for the data records of an
+    S-record file, given its lines.
+    """
+    address_sizes = {'1': 2, '2': 3, '3': 4}
+    for number, line in enumerate(lines, 1):
+        line = line.strip()
+        if not line:
+            continue
+        if len(line) < 2 or line[0] not in 'Ss':
+            raise ValueError(f'Line {number}: S-records start with "S"')
+        fields = parse_record(line[2:], number)
+        if len(fields) != fields[0] + 1:
+            raise ValueError(f'Line {number}: record length does not match its byte count')
+        if sum(fields) & 0xFF != 0xFF:
+            raise ValueError(f'Line {number}: checksum error')
+
+        record_type = line[1]
+        if record_type in address_sizes:
+            size = address_sizes[record_type]
+            yield int.from_bytes(fields[1:1 + size], 'big'), fields[1 + size:-1]
+        elif record_type in '789':
+            return
+        elif record_type not in '056':
+            raise ValueError(f'Line {number}: unknown record type S{record_type}')
+
+
+def word_runs(records):
+    """ Join (byte address, data) records into runs of consecutive
+    words. Yields (start address, array of words) as soon as a gap
+    ends a run.
+    """
+    start = None
+    run = bytearray()
+    for address, data in records:
+        if start is not None and address == start + len(run):
+            run += data
+            continue
+        if start is not None:
+            yield to_words(start, run)
+        start = address
+        run = bytearray(data)
+    if start is not None and run:
+        yield to_words(start, run)
+
+
+def to_words(start: int, data: bytearray) -> tuple[int, array]:
+    if start % 2 or len(data) % 2:
+        raise ValueError(f'Data at byte address 0x{start:04x} is not a whole number of words')
+    words = array('H')
+    words.frombytes(data)
+    if sys.byteorder == 'little':
+        words.byteswap()
+    return start // 2, words
+
+
+def image_format(text: str) -> str:
+    # 'ihex', 'srec' or 'text' from the first character of a text image
+    first = text.lstrip()[:1]
+    if first == ':':
+        return 'ihex'
+    elif first in ('S', 's'):
+        return 'srec'
+    return 'text'
+
+
+def segments(lines, image_type: str):
+    # Word runs of an Intel HEX or S-record file, read lazily
+    records = ihex_data(lines) if image_type == 'ihex' else srec_data(lines)
+    return word_runs(records)
@@ -0,0 +1,333 @@
+#!/usr/bin/python3
+# -*- coding: utf-8 -*-
+# File: incremental.py
+""" Tiny-T Incremental Assembler
+Tiny-T is a simple CPU Simulator intended as a teaching aid for students
+learning about computer architecture.
+This program is free software: you can redistribute it and/or modify it under
+the terms of the GNU General Public License as published by the Free Software
+Foundation, either version 2 of the License, or (at your option) any later
+version.
+This program is distributed in the hope that it will be useful, but WITHOUT
+ANY WARRANTY; without even the implied warranty of MERCHANTABILITY or FITNESS
+FOR A PARTICULAR PURPOSE. See the GNU General Public License for more details.
+You should have received a copy of the GNU General Public License along with
+this program. If not, see <http://www.gnu.org/licenses/>.
+"""
+
+__author__ = "Randall Morgan"
+__contact__ = "rmorgan@coderancher.us"
+__copyright__ = "Copyright 2022, SensorNet"
+__credits__ = ["Randall Morgan", "SensorNet.Us"]
+__date__ = "2022/05/23"
+__deprecated__ = False
+__email__ = "rmorgan@coderancher.us"
+__license__ = "GPLv2 or Later"
+__maintainer__ = "Randall Morgan"
+__status__ = "Production"
+__version__ = "1.0.0"
+
+# The incremental assembler keeps the result of the last
+# assembly: the parsed statement for every line, the address
+# each line was placed at, the symbol table and the image.
+# When it is handed an edited copy of the source it only
+# re-parses the lines that changed, re-lays out addresses until
+# they line up with the previous layout again, re-resolves the
+# lines that refer to symbols that moved, and reports the
+# memory words that now hold a different value.
+#
+# Usage:
+#   asm = IncrementalAssembler(Lexer(), text)   # or (Lexer(TINY_P.opcodes), text, isa=TINY_P)
+#   machine_text = asm.parse()
+#   ...edit text...
+#   for address, word in asm.update(text):
+#       cpu.write(address, word)
+
+from itertools import compress, count
+from operator import ne
+
+from assembler import Assembler, Expression, Lexer, Preprocessor, Statement, to_text, uses_preprocessor
+from isa import ISA, TINY_T
+
+
+def operand_symbols(operand) -> list[str]:
+    if isinstance(operand, str):
+        return [operand]
+    elif isinstance(operand, Expression):
+        return operand.symbols()
+    return []
+
+
+def statement_symbols(statement: Statement) -> set[str]:
+    names = set()
+    for operand in statement.operands():
+        names.update(operand_symbols(operand))
+    return names
+
+
+def common_length(a, b, limit: int) -> int:
+    # Length of the common head of two sequences, at most limit.
+    # The comparison runs inside map() and compress() so no Python
+    # code runs per line.
+    mismatches = compress(count(), map(ne, a, b))
+    return min(next(mismatches, limit), limit)
+
+
+class SourceLine:
+    """ One line of source and the words it placed in the image. """
+
+    def __init__(self, text: str, statement: Statement):
+        self.text = text
+        self.statement = statement
+        self.address = 0
+        self.placed = None
+        self.words = []
+
+    def covers(self, address: int) -> bool:
+        return self.placed is not None and self.placed <= address < self.placed + len(self.words)
+
+    @property
+    def end(self) -> int:
+        # Location counter after this line
+        if self.statement.origin is not None:
+            return self.statement.origin
+        return self.address + self.statement.size
+
+
+class IncrementalAssembler(Assembler):
+    def __init__(self, lexer: Lexer, _text: str = '', filename: str = '<source>', isa: ISA = TINY_T):
+        super().__init__(lexer, _text, filename, isa)
+        self.source = []
+        self.source_lines = []
+        self.image = {}
+        # Source text -> parsed Statement
+        self.parsed = {}
+        self.references = {}
+        self.definers = {}
+        self.writers = {}
+        self.unresolved = set()
+        self.before = {}
+        self.old_symbols = {}
+
+    def statement(self, text: str) -> Statement:
+        # Parsing a line depends only on its text, so parsed
+        # statements are shared between identical lines.
+        statement = self.parsed.get(text)
+        if statement is None:
+            statement = self.parse_statement(text)
+            if statement.value is not None and not isinstance(statement.value, int):
+                msg = f'EQU. constants must be numbers for incremental assembly: {text.strip()}'
+                raise ValueError(msg)
+            self.parsed[text] = statement
+        return statement
+
+    def parse(self):
+        # Full assembly. Returns the same text as Assembler.parse()
+        self.source = []
+        self.source_lines = []
+        self.image = {}
+        self.references = {}
+        self.definers = {}
+        self.writers = {}
+        self.unresolved = set()
+        self.symbol_table = {}
+        self.update(self.text)
+        self.check()
+        return self.machine_text()
+
+    def check(self):
+        if self.unresolved:
+            names = set()
+            for line in self.unresolved:
+                names.update(statement_symbols(line.statement))
+            names.difference_update(self.symbol_table)
+            msg = f"Undefined Symbol: {', '.join(sorted(names))}"
+            raise ValueError(msg)
+
+    def machine_text(self) -> str:
+        return to_text(sorted(self.image.items()), self.isa)
+
+    def update(self, text: str) -> list[tuple[int, int]]:
+        """ Re-assemble an edited copy of the source. Returns the
+        sorted (address, word) pairs that changed. Addresses that
+        no longer hold code are reported with a word of 0. Lines
+        whose operand is undefined place no word and are listed in
+        self.unresolved until the symbol is defined again.
+        """
+        if uses_preprocessor(text):
+            # Macros and includes are expanded first, and the
+            # expanded lines are compared with the last expansion.
+            lines = Preprocessor(self.include_path).run(text, self.filename)
+        else:
+            lines = text.split('\n')
+        source = self.source
+        old_lines = self.source_lines
+
+        # Only the lines between the common head and tail changed
+        limit = min(len(old_lines), len(lines))
+        start = common_length(old_lines, lines, limit)
+        tail = common_length(reversed(old_lines), reversed(lines), limit - start)
+        old_end, new_end = len(source) - tail, len(lines) - tail
+
+        # Parse before touching any state so a syntax error leaves
+        # the previous assembly intact.
+        inserted = [SourceLine(line, self.statement(line)) for line in lines[start:new_end]]
+        removed = source[start:old_end]
+        source[start:old_end] = inserted
+        self.text = text
+        self.lines = lines
+        self.source_lines = lines
+        self.before = {}
+        self.old_symbols = {}
+
+        for line in removed:
+            self._unplace(line)
+            self._undefine(line)
+            self._unreference(line)
+
+        dirty = set(inserted)
+        for line in inserted:
+            self._reference(line)
+
+        # Lay out addresses from the first edited line until the
+        # location counter agrees with the previous layout again.
+        counter = source[start - 1].end if start else 0
+        stop = start + len(inserted)
+        for index in range(start, len(source)):
+            line = source[index]
+            if index >= stop:
+                if line.address == counter:
+                    break
+                self._undefine(line)
+                dirty.add(line)
+            line.address = counter
+            self._define(line)
+            counter = line.end
+
+        # Lines referring to a symbol that moved must be re-encoded
+        for name, value in self.old_symbols.items():
+            if self.symbol_table.get(name) != value:
+                dirty.update(self.references.get(name, ()))
+
+        # Every dirty line leaves its old words before any is placed
+        # again. Otherwise a line moved by an insert would land on
+        # its neighbour's old words and each address would need
+        # settling, which is a scan of the whole source.
+        for line in dirty:
+            self._unplace(line)
+        for line in dirty:
+            self._place(line)
+
+        self._prune_parsed()
+
+        changes = []
+        for address in sorted(self.before):
+            word = self.image.get(address)
+            if word != self.before[address]:
+                changes.append((address, 0 if word is None else word))
+        return changes
+
+    def _last_line(self, predicate):
+        # The last line in source order wins, as it does in a
+        # full assembly.
+        for line in reversed(self.source):
+            if predicate(line):
+                return line
+        return None
+
+    def _reference(self, line: SourceLine):
+        for name in statement_symbols(line.statement):
+            self.references.setdefault(name, set()).add(line)
+
+    def _unreference(self, line: SourceLine):
+        for name in statement_symbols(line.statement):
+            users = self.references[name]
+            users.discard(line)
+            if not users:
+                del self.references[name]
+
+    @staticmethod
+    def _label_value(line: SourceLine) -> int:
+        # Labels name the line's address, or an EQU. constant
+        if line.statement.value is not None:
+            return line.statement.value
+        return line.address
+
+    def _define(self, line: SourceLine):
+        for name in line.statement.labels:
+            self.old_symbols.setdefault(name, self.symbol_table.get(name))
+            count = self.definers.get(name, 0) + 1
+            self.definers[name] = count
+            if count == 1:
+                self.symbol_table[name] = self._label_value(line)
+            else:
+                owner = self._last_line(lambda l: name in l.statement.labels)
+                self.symbol_table[name] = self._label_value(owner)
+
+    def _undefine(self, line: SourceLine):
+        for name in line.statement.labels:
+            self.old_symbols.setdefault(name, self.symbol_table.get(name))
+            count = self.definers[name] - 1
+            if count == 0:
+                del self.definers[name]
+                del self.symbol_table[name]
+            else:
+                self.definers[name] = count
+                owner = self._last_line(lambda l: l is not line and name in l.statement.labels)
+                self.symbol_table[name] = self._label_value(owner)
+
+    def _touch(self, address: int):
+        self.before.setdefault(address, self.image.get(address))
+
+    def _settle(self, address: int):
+        owner = self._last_line(lambda l: l.covers(address))
+        self.image[address] = owner.words[address - owner.placed]
+
+    def _place(self, line: SourceLine):
+        self._unplace(line)
+        statement = line.statement
+        operands = statement.operands()
+        if not operands:
+            return
+
+        for name in statement_symbols(statement):
+            if name not in self.symbol_table:
+                self.unresolved.add(line)
+                return
+
+        if statement.opcode is not None:
+            line.words = [self.encode(statement.opcode, self.resolve(statement.operand))]
+        else:
+            line.words = [self.encode(None, self.resolve(value)) for value in operands]
+
+        line.placed = line.address
+        for address, word in enumerate(line.words, line.address):
+            self._touch(address)
+            count = self.writers.get(address, 0) + 1
+            self.writers[address] = count
+            if count == 1:
+                self.image[address] = word
+            else:
+                self._settle(address)
+
+    def _unplace(self, line: SourceLine):
+        self.unresolved.discard(line)
+        start = line.placed
+        if start is None:
+            return
+
+        line.placed = None
+        for address in range(start, start + len(line.words)):
+            self._touch(address)
+            count = self.writers[address] - 1
+            if count == 0:
+                del self.writers[address]
+                del self.image[address]
+            else:
+                self.writers[address] = count
+                self._settle(address)
+
+    def _prune_parsed(self):
+        # Drop parsed statements for text that is no longer in the source
+        if len(self.parsed) > 2 * len(self.source) + 1024:
+            self.parsed = {line.text: line.statement for line in self.source}
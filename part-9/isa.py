@@ -0,0 +1,168 @@
+#!/usr/bin/python3
+# -*- coding: utf-8 -*-
+# File: isa.py
+""" Tiny-T Instruction Set Descriptions
+Tiny-T is a simple CPU Simulator intended as a teaching aid for students
+learning about computer architecture.
+This program is free software: you can redistribute it and/or modify it under
+the terms of the GNU General Public License as published by the Free Software
+Foundation, either version 2 of the License, or (at your option) any later
+version.
+This program is distributed in the hope that it will be useful, but WITHOUT
+ANY WARRANTY; without even the implied warranty of MERCHANTABILITY or FITNESS
+FOR A PARTICULAR PURPOSE. See the GNU General Public License for more details.
+You should have received a copy of the GNU General Public License along with
+this program. If not, see <http://www.gnu.org/licenses/>.
+"""
+
+__author__ = "Randall Morgan"
+__contact__ = "rmorgan@coderancher.us"
+__copyright__ = "Copyright 2022, SensorNet"
+__credits__ = ["Randall Morgan", "SensorNet.Us"]
+__date__ = "2022/05/23"
+__deprecated__ = False
+__email__ = "rmorgan@coderancher.us"
+__license__ = "GPLv2 or Later"
+__maintainer__ = "Randall Morgan"
+__status__ = "Production"
+__version__ = "1.0.0"
+
+# An ISA object describes everything the assembler needs to know
+# about a target: its mnemonics, how an opcode and operand are
+# encoded into a machine word, the operand and data word ranges,
+# the size of the address space and how machine words are written
+# in the text .bin format. The assembler engine is shared by every
+# target; adding a target means adding an ISA object to ISAS.
+
+
+class ISA:
+    def __init__(self, name: str, opcodes: dict, encoder, decoder, operand_max: int, word_min: int,
+                 word_max: int, address_space: int, line_format: str, word_format: str):
+        self.name = name
+        self.opcodes = opcodes
+        self.mnemonics = {opcode: mnemonic for mnemonic, opcode in opcodes.items()}
+        self.encoder = encoder
+        self.decoder = decoder
+        self.operand_max = operand_max
+        self.word_min = word_min
+        self.word_max = word_max
+        self.address_space = address_space
+        # Format of a line of the text .bin format, given the
+        # address and the word, and of words and addresses in
+        # listings
+        self.line_format = line_format
+        self.word_format = word_format
+
+    def encode(self, opcode: int, operand: int) -> int:
+        # An opcode of None marks a data word
+        if opcode is None:
+            if not self.word_min <= operand <= self.word_max:
+                raise ValueError(f"Data word out of range {operand}")
+            return operand % (self.word_max + 1)
+        if not 0 <= operand <= self.operand_max:
+            raise ValueError(f"Illegal Operand Value {operand}")
+        return self.encoder(opcode, operand)
+
+    def decode(self, word: int) -> tuple[int, int]:
+        # Split a machine word into (opcode, operand)
+        return self.decoder(word)
+
+    def format_word(self, word: int) -> str:
+        return format(word, self.word_format)
+
+    def __repr__(self) -> str:
+        return f'ISA({self.name!r})'
+
+
+# Tiny-T CPU Instructions
+# OPCODE | Mnemonic | Description
+# -----------------------------------------------------
+# 0xxx | HLT       | Halt
+# 1xxx | LDA (xxx) | Load Acc
+# 2xxx | STA (xxx) | Store A at Mem[xxx]
+# 3xxx | ADD (xxx) | Add Mem[xxx] to Acc
+# 4xxx | SUB (xxx) | Subtract Mem[xxx] from Acc
+# 5xxx | AND (xxx) | Logical ADN ACC and Mem[xxx]
+# 6xxx | OR  (xxx) | Logical OR ACC and Mem[xxx]
+# 7xxx | XOR (xxx) | Logical XOR ACC and Mem[xxx]
+# 8xxx | NOT       | Bitwise Invert ACC
+# 9xxx | SHL       | Shift ACC left one bit
+# Axxx | SHR       | Shift ACC right one bit
+# Baaa | BRA aaa   | Unconditional branch to address aaa
+# Caaa | BRP aaa   | Branch on positive to aaa
+# Daaa | BRZ aaa   | Branch on zero to aaa
+# E0pp | INP pp    | ACC <- I/O port[pp]
+# F0pp | OUT pp    | I/O port[pp] <- ACC
+#
+TINY_T = ISA(
+    name='tiny-t',
+    opcodes={
+        'htl': 0x0,
+        'lda': 0x1,
+        'sta': 0x2,
+        'add': 0x3,
+        'sub': 0x4,
+        'and': 0x5,
+        'or': 0x6,
+        'xor': 0x7,
+        'not': 0x8,
+        'shl': 0x9,
+        'shr': 0xA,
+        'bra': 0xB,
+        'brp': 0xC,
+        'brz': 0xD,
+        'inp': 0xE,
+        'out': 0xF
+    },
+    encoder=lambda opcode, operand: (opcode << 12) + operand,
+    decoder=lambda word: (word >> 12, word & 0x0FFF),
+    operand_max=0xFFF,
+    # Data words may be written as signed or unsigned 16 bit values
+    word_min=-0x8000,
+    word_max=0xFFFF,
+    address_space=0x1000,
+    line_format='{:04d} {}\n',
+    word_format='04X',
+)
+
+# Tiny-P CPU Instructions (part-5)
+# Machine words are decimal: opcode * 100 + operand
+# OPCODE | Mnemonic | Description
+# -----------------------------------------------------
+# 0xx | NOP       | No operation
+# 1xx | LDA (xx)  | Load Acc
+# 2xx | STA (xx)  | Store A at Mem[xx]
+# 3xx | AND (xx)  | Logical AND ACC and Mem[xx]
+# 4xx | OR  (xx)  | Logical OR ACC and Mem[xx]
+# 5xx | NOT       | Invert ACC
+# 6xx | ADD (xx)  | Add Mem[xx] to Acc
+# 7xx | SUB (xx)  | Subtract Mem[xx] from Acc
+# 8aa | BRZ aa    | Branch on zero to aa
+# 9aa | BRP aa    | Branch on positive to aa
+#
+TINY_P = ISA(
+    name='tiny-p',
+    opcodes={
+        'nop': 0,
+        'lda': 1,
+        'sta': 2,
+        'and': 3,
+        'or': 4,
+        'not': 5,
+        'add': 6,
+        'sub': 7,
+        'brz': 8,
+        'brp': 9
+    },
+    encoder=lambda opcode, operand: opcode * 100 + operand,
+    decoder=lambda word: divmod(word, 100),
+    operand_max=99,
+    word_min=0,
+    word_max=999,
+    address_space=100,
+    # The layout written by the part-5 assembler
+    line_format='{:03d}  {}\n',
+    word_format='03d',
+)
+
+ISAS = {isa.name: isa for isa in (TINY_T, TINY_P)}
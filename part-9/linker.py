@@ -0,0 +1,288 @@
+#!/usr/bin/python3
+# -*- coding: utf-8 -*-
+# File: linker.py
+""" Tiny-T Linker
+Tiny-T is a simple CPU Simulator intended as a teaching aid for students
+learning about computer architecture.
+This program is free software: you can redistribute it and/or modify it under
+the terms of the GNU General Public License as published by the Free Software
+Foundation, either version 2 of the License, or (at your option) any later
+version.
+This program is distributed in the hope that it will be useful, but WITHOUT
+ANY WARRANTY; without even the implied warranty of MERCHANTABILITY or FITNESS
+FOR A PARTICULAR PURPOSE. See the GNU General Public License for more details.
+You should have received a copy of the GNU General Public License along with
+this program. If not, see <http://www.gnu.org/licenses/>.
+"""
+
+__author__ = "Randall Morgan"
+__contact__ = "rmorgan@coderancher.us"
+__copyright__ = "Copyright 2022, SensorNet"
+__credits__ = ["Randall Morgan", "SensorNet.Us"]
+__date__ = "2022/05/23"
+__deprecated__ = False
+__email__ = "rmorgan@coderancher.us"
+__license__ = "GPLv2 or Later"
+__maintainer__ = "Randall Morgan"
+__status__ = "Production"
+__version__ = "1.0.0"
+
+# Relocatable Object Modules
+# A module is assembled as if it starts at address 0. Its
+# labels are module relative and ORG. sets an offset within
+# the module. Symbols are shared between modules with:
+#
+#   EXPORT. mul, print     # Make labels visible to other modules
+#   IMPORT. mul            # Use a label exported by another module
+#
+# Every word whose operand is a label carries a relocation
+# entry. When the linker places the module at its base address
+# it adds the base to local label operands and the address of
+# the exported symbol to imported ones.
+#
+# Object modules are saved as JSON text (*.tto) so they can be
+# read by students as well as by the linker. Relocation patches
+# Tiny-T words, so modules are always Tiny-T code.
+#
+# Usage: linker.py [-b] [-j <jobs>] -o <outputfile> main.asm lib.tto ...
+# The first module is placed at the link origin (address 0),
+# where the CPU starts executing.
+
+import getopt
+import json
+import sys
+from concurrent.futures import ProcessPoolExecutor
+
+import packed
+from assembler import Assembler, Expression, Lexer, to_text
+from isa import TINY_T
+
+OBJECT_EXTENSION = '.tto'
+OBJECT_FORMAT = 'tiny-t-object'
+OBJECT_VERSION = 2
+
+
+class ObjectModule:
+    def __init__(self, name: str = ''):
+        self.name = name
+        self.size = 0
+        self.words = []
+        self.exports = {}
+        self.imports = []
+        self.relocations = {}
+        self.data = set()
+
+    @staticmethod
+    def from_assembler(asm: Assembler, name: str = ''):
+        # Build a module from an assembler that has run collect()
+        module = ObjectModule(name)
+        imports = set(asm.imports)
+        for addr, opcode, operand in asm.code:
+            if not isinstance(operand, int):
+                operand, target = ObjectModule.relocate(asm, operand, imports)
+                if target != '':
+                    module.relocations[addr] = target
+                    if opcode is None:
+                        # Relocated data words are patched as a whole
+                        module.data.add(addr)
+            module.words.append((addr, asm.encode(opcode, operand)))
+            module.size = max(module.size, addr + 1)
+
+        for name_ in asm.exports:
+            if name_ not in asm.symbol_table:
+                raise ValueError(f"Undefined Export: {name_}")
+            elif name_ in asm.constants:
+                raise ValueError(f"EQU. constants can not be exported: {name_}")
+            module.exports[name_] = asm.symbol_table[name_]
+
+        module.imports = sorted(imports)
+        module.size = max(module.size, asm.current_address)
+        return module
+
+    @staticmethod
+    def relocate(asm: Assembler, operand, imports: set):
+        # Split an operand into its value within the module and
+        # what the linker must add to it: '' for nothing, None for
+        # the module base, or the name of an imported symbol.
+        terms = operand.terms if isinstance(operand, Expression) else [(1, operand)]
+        value = 0
+        bases = 0
+        target = ''
+        for sign, term in terms:
+            if isinstance(term, int):
+                value += sign * term
+            elif term in asm.symbol_table:
+                value += sign * asm.symbol_table[term]
+                if term not in asm.constants:
+                    bases += sign
+            elif term in imports and sign > 0 and not target:
+                target = term
+            elif term in imports:
+                raise ValueError(f"Operand {operand} can not be relocated")
+            else:
+                msg = f"Undefined Symbol: {term}"
+                raise ValueError(msg)
+
+        if bases == 1 and not target:
+            return value, None
+        elif bases == 0:
+            return value, target
+        raise ValueError(f"Operand {operand} can not be relocated")
+
+    @staticmethod
+    def assemble(text: str, name: str = ''):
+        asm = Assembler(Lexer(), text, name or '<source>')
+        # Only the first pass runs. Imported names are left
+        # for the linker to resolve.
+        asm.collect()
+        return ObjectModule.from_assembler(asm, name)
+
+    def to_json(self) -> str:
+        return json.dumps({
+            'format': OBJECT_FORMAT,
+            'version': OBJECT_VERSION,
+            'name': self.name,
+            'size': self.size,
+            'words': self.words,
+            'exports': self.exports,
+            'imports': self.imports,
+            'relocations': sorted(self.relocations.items()),
+            'data': sorted(self.data),
+        }, indent=1)
+
+    @staticmethod
+    def from_json(text: str):
+        data = json.loads(text)
+        if data.get('format') != OBJECT_FORMAT or data.get('version') != OBJECT_VERSION:
+            raise ValueError('Not a Tiny-T object module')
+        module = ObjectModule(data['name'])
+        module.size = data['size']
+        module.words = [tuple(pair) for pair in data['words']]
+        module.exports = data['exports']
+        module.imports = data['imports']
+        module.relocations = {addr: target for addr, target in data['relocations']}
+        module.data = set(data['data'])
+        return module
+
+    def save(self, path: str):
+        with open(path, 'w') as ofh:
+            ofh.write(self.to_json())
+
+    @staticmethod
+    def load(path: str):
+        with open(path, 'r') as ifh:
+            return ObjectModule.from_json(ifh.read())
+
+
+class Linker:
+    def __init__(self, origin: int = 0):
+        self.origin = origin
+        self.modules = []
+        self.symbol_table = {}
+
+    def add(self, module: ObjectModule):
+        self.modules.append(module)
+
+    def link(self) -> list[tuple[int, int]]:
+        # Place the modules one after another, then patch
+        # the relocated words. Returns (address, word) pairs.
+        bases = []
+        base = self.origin
+        self.symbol_table = {}
+        for module in self.modules:
+            bases.append(base)
+            for name, offset in module.exports.items():
+                if name in self.symbol_table:
+                    raise ValueError(f"Duplicate Export: {name} in {module.name}")
+                self.symbol_table[name] = base + offset
+            base += module.size
+
+        if base > 0x1000:
+            raise ValueError(f"Linked image of {base - self.origin} words exceeds the address space")
+
+        words = []
+        for module, base in zip(self.modules, bases):
+            for addr, word in module.words:
+                if addr in module.relocations:
+                    target = module.relocations[addr]
+                    if target is None:
+                        value = base
+                    elif target in self.symbol_table:
+                        value = self.symbol_table[target]
+                    else:
+                        msg = f"Undefined Symbol: {target} imported by {module.name}"
+                        raise ValueError(msg)
+                    if addr in module.data:
+                        word = TINY_T.encode(None, word + value)
+                    else:
+                        operand = (word & 0x0FFF) + value
+                        word = TINY_T.encode(word >> 12, operand)
+                words.append((base + addr, word))
+        return words
+
+
+def load_module(path: str) -> ObjectModule:
+    # Object modules are read, sources are assembled. Module level
+    # so it can run in a worker process.
+    with open(path, 'r') as ifh:
+        text = ifh.read()
+    if path.endswith(OBJECT_EXTENSION):
+        module = ObjectModule.from_json(text)
+    else:
+        module = ObjectModule.assemble(text)
+    module.name = module.name or path
+    return module
+
+
+def main(argv):
+    outputfile = ''
+    binary = False
+    jobs = None
+    usage_message = "Usage: linker.py [-b] [-j <jobs>] -o <outputfile> <module> [<module> ...]"
+
+    try:
+        opts, args = getopt.getopt(argv, "hbj:o:", ["help", "binary", "jobs=", "ofile="])
+    except getopt.GetoptError:
+        print(usage_message)
+        sys.exit(2)
+
+    for opt, arg in opts:
+        if opt in ('-h', '--help'):
+            print(usage_message)
+            sys.exit()
+        elif opt in ('-o', '--ofile'):
+            outputfile = arg
+        elif opt in ('-b', '--binary'):
+            binary = True
+        elif opt in ('-j', '--jobs'):
+            jobs = int(arg)
+
+    if not args or not outputfile:
+        print(usage_message)
+        sys.exit(2)
+
+    # Modules are independent until link time, so
+    # sources are assembled in parallel.
+    if len(args) > 1 and jobs != 1:
+        with ProcessPoolExecutor(max_workers=jobs) as pool:
+            modules = list(pool.map(load_module, args))
+    else:
+        modules = [load_module(path) for path in args]
+
+    linker = Linker()
+    for module in modules:
+        linker.add(module)
+    words = linker.link()
+
+    if binary:
+        with open(outputfile, 'wb') as ofh:
+            ofh.write(packed.pack(words))
+    else:
+        with open(outputfile, 'w') as ofh:
+            ofh.write(to_text(words))
+
+    print(f"Linked: {len(modules)} modules and wrote machine code to {outputfile}")
+
+
+if __name__ == '__main__':
+    main(sys.argv[1:])
@@ -33,29 +33,194 @@ __version__ = "1.0.0"
 # Where the address is a 4-digit decimal
 # value and the opcode is a 4-digit
 # decimal value.
+# Packed binary images (*.tbin, see packed.py)
+# are also accepted and are recognised by
+# their magic number, as are Intel HEX and
+# S-record files (see hexfile.py).
+#
+# Images are turned into runs of consecutive words held in uint16
+# arrays, and each run is copied into the RAM that holds it with a
+# single block write instead of a bus write per word.
+#
+# The machine has RAM_WORDS words of RAM, the whole Tiny-T
+# address space, so images built by translate.py, which places
+# code at 0x100 and data at 0xF00, can be run. -m sets a smaller
+# or larger RAM.
 
 import getopt
+import io
+import os
 import sys
+from array import array
+from collections import OrderedDict
 
+import hexfile
+import packed
 from bus import Bus
 from console import Console
 from cpu import CPU
 from memory import Memory
 
+RAM_WORDS = 4096
+
+
+def parse_lines(code_text: str) -> list[tuple[int, array]]:
+    # Line by line parse. Lines that are not an address and a
+    # word are skipped.
+    words = []
+    for line in code_text.split('\n'):
+        code = line.split()
+        if len(code) == 2:
+            words.append((int(code[0]), int(code[1])))
+    return packed.segments(words)
+
+
+def parse_text(code_text: str) -> list[tuple[int, array]]:
+    """ Parse a text image into (start address, words) runs.
+    The numbers are converted by map() and array() without a
+    Python loop per line. Images with malformed lines fall back
+    to parse_lines().
+    """
+    tokens = code_text.split()
+    lines = code_text.split('\n')
+    if len(tokens) != 2 * (len(lines) - lines.count('')):
+        return parse_lines(code_text)
+
+    try:
+        addresses = array('l', map(int, tokens[0::2]))
+        words = array('H', map(int, tokens[1::2]))
+    except (ValueError, OverflowError):
+        raise ValueError('Malformed text image')
+
+    if addresses:
+        first = addresses[0]
+        if addresses == array('l', range(first, first + len(addresses))):
+            # The usual case: one run of consecutive addresses
+            return [(first, words)]
+    return packed.segments(zip(addresses, words))
+
+
+def image_segments(code_text):
+    # The (start address, words) runs of a text, hex or packed image
+    if isinstance(code_text, str):
+        image_type = hexfile.image_format(code_text)
+        if image_type == 'text':
+            return parse_text(code_text)
+        # Records are read and checked in one pass. The runs are
+        # kept in a list so the image can be loaded more than once.
+        return list(hexfile.segments(io.StringIO(code_text), image_type))
+    return packed.unpack(code_text)
+
+
+class Image:
+    """ A parsed program image. The words of each segment are a
+    read only uint16 view, so one image can be loaded into any
+    number of machines and can not be changed by any of them.
+    """
+
+    def __init__(self, segments):
+        self.segments = tuple((start, memoryview(bytes(memoryview(words))).cast('H'))
+                              for start, words in segments)
+        self.size = sum(len(words) for start, words in self.segments)
+
+
+class ImageCache:
+    """ Parsed images shared by every loader in the process, keyed
+    by path and checked against the file's size and modification
+    time. The cache holds at most max_words words; the least
+    recently used images are dropped first.
+    """
+
+    def __init__(self, max_words: int = 1 << 20):
+        self.max_words = max_words
+        self.images = OrderedDict()
+        self.words = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def load(self, path: str) -> Image:
+        info = os.stat(path)
+        key = os.path.abspath(path)
+        stamp = (info.st_size, info.st_mtime_ns)
+        entry = self.images.get(key)
+        if entry is not None and entry[0] == stamp:
+            self.hits += 1
+            self.images.move_to_end(key)
+            return entry[1]
+
+        self.misses += 1
+        image = Image(image_segments(read_image(path)))
+        if entry is not None:
+            self.words -= entry[1].size
+        self.images[key] = (stamp, image)
+        self.images.move_to_end(key)
+        self.words += image.size
+        self.evict()
+        return image
+
+    def evict(self):
+        while self.words > self.max_words and len(self.images) > 1:
+            stamp, image = self.images.popitem(last=False)[1]
+            self.words -= image.size
+            self.evictions += 1
+
+    def clear(self):
+        self.images.clear()
+        self.words = 0
+
+    def stats(self) -> dict:
+        lookups = self.hits + self.misses
+        return {
+            'hits': self.hits,
+            'misses': self.misses,
+            'evictions': self.evictions,
+            'entries': len(self.images),
+            'words': self.words,
+            'max_words': self.max_words,
+            'hit_rate': self.hits / lookups if lookups else 0.0,
+        }
+
+
+# Shared by every loader in the process
+IMAGE_CACHE = ImageCache()
+
 
 class Loader:
-    def __init__(self, cpu: CPU, code_text: str):
+    def __init__(self, cpu: CPU, code_text):
+        # code_text is a text, hex or packed image, or an Image
         self.machine_code = code_text
-        self.code = self.machine_code.split('\n')
         self.cpu = cpu
+        if isinstance(code_text, Image):
+            self.segments = code_text.segments
+        else:
+            self.segments = image_segments(code_text)
+        self.words_loaded = 0
+
+    def find_ram(self, start: int, count: int) -> Memory:
+        # The writable memory on the cpu's bus that holds the block
+        for handler in self.cpu.bus.handlers:
+            if isinstance(handler, Memory) and not handler.read_only and handler.holds(start, count):
+                return handler
+        msg = f'No RAM at 0x{start:04x} - 0x{start + count - 1:04x} to load the image into'
+        raise ValueError(msg)
+
+    def load(self) -> int:
+        # Returns the number of words loaded
+        self.words_loaded = 0
+        for start, words in self.segments:
+            memory = self.find_ram(start, len(words))
+            self.words_loaded += memory.write_block(start, words)
+        return self.words_loaded
+
 
-    def load(self):
-        for line in self.code:
-            code = line.split()
-            if len(code) == 2:
-                addr = int(code[0])
-                opcode = int(code[1])
-                self.cpu.write(addr, opcode)
+def read_image(inputfile: str):
+    # Returns bytes for a packed image, otherwise the text
+    with open(inputfile, 'rb') as ifh:
+        data = ifh.read()
+    if packed.is_packed(data):
+        return data
+    return data.decode()
 
 
 def dump(cpu: CPU):
@@ -72,10 +237,11 @@ def dump_mem(mem: list):
 
 def main(argv):
     inputfile = ''
-    usage_message = "Usage: assembler.py -i <inputfile> "
+    ram_words = RAM_WORDS
+    usage_message = "Usage: loader.py [-m <ram words>] -i <inputfile> "
 
     try:
-        opts, args = getopt.getopt(argv, "hi:", ["help", "ifile="])
+        opts, args = getopt.getopt(argv, "hi:m:", ["help", "ifile=", "memory="])
     except getopt.GetoptError:
         print(usage_message)
         sys.exit(2)
@@ -85,17 +251,17 @@ def main(argv):
             sys.exit()
         elif opt in ('-i', '--ifile'):
             inputfile = arg
+        elif opt in ('-m', '--memory'):
+            ram_words = int(arg, 0)
 
     if not inputfile:
         print(usage_message)
         sys.exit(2)
 
-    with open(inputfile, 'r') as ifh:
-        program_text = ifh.read()
-    ifh.close()
+    image = IMAGE_CACHE.load(inputfile)
 
     # Build up Computer Stem
-    ram = Memory(64, 16)
+    ram = Memory(ram_words, 16)
     con = Console()
     bus = Bus()
     bus.register_handler(ram)
@@ -103,11 +269,11 @@ def main(argv):
     cpu = CPU(bus)
 
     # Loader Program
-    loader = Loader(cpu, program_text)
-    loader.load()
+    loader = Loader(cpu, image)
+    count = loader.load()
 
     # Exit message
-    print(f"Loader: {inputfile} loaded in to cpu.")
+    print(f"Loader: {inputfile} loaded {count} words in to cpu.")
     print(f"Ready to run!")
 
     # Run the program
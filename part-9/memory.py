@@ -30,12 +30,52 @@ from random import randint
 
 from bus import BusClient
 
+# Ranges a WriteTracker holds before it merges them
+MAX_RANGES = 1024
+
+
+class WriteTracker:
+    """ Records the address ranges written since the last call to
+    take(). Created by Memory.track_writes(), so views of memory can
+    redraw only what changed.
+    """
+
+    def __init__(self):
+        self.ranges = []
+
+    def mark(self, start: int, end: int):
+        # Addresses start up to, but not including, end were written
+        self.ranges.append((start, end))
+        if len(self.ranges) > MAX_RANGES:
+            self.ranges = self.merged()
+            if len(self.ranges) > MAX_RANGES // 2:
+                # Too scattered to be worth keeping apart
+                self.ranges = [(self.ranges[0][0], self.ranges[-1][1])]
+
+    def merged(self) -> list[tuple[int, int]]:
+        merged = []
+        for start, end in sorted(self.ranges):
+            if merged and start <= merged[-1][1]:
+                if end > merged[-1][1]:
+                    merged[-1] = (merged[-1][0], end)
+            else:
+                merged.append((start, end))
+        return merged
+
+    def take(self) -> list[tuple[int, int]]:
+        # The sorted, merged ranges written since the last take()
+        ranges = self.merged()
+        self.ranges = []
+        return ranges
+
 
 class Memory(BusClient):
     mem = []
     start_address = 0
     end_address = 4096
     bit_mask = 0
+    # Write trackers to notify, see track_writes()
+    trackers = []
 
     def __init__(self, size: int, bit_width: int, read_only=False):
         self.bit_width = bit_width
@@ -48,12 +88,33 @@ class Memory(BusClient):
 
     def clear(self):
         Memory.mem = [0 for _ in range(self.size)]
+        Memory.mark_written(0, self.size)
 
     def fill(self, value: int):
         Memory.mem = [value for _ in range(self.size)]
+        Memory.mark_written(0, self.size)
 
     def random_fill(self):
         Memory.mem = [(randint(0, Memory.bit_mask)) for _ in range(self.size)]
+        Memory.mark_written(0, self.size)
+
+    @staticmethod
+    def track_writes() -> WriteTracker:
+        # Start recording writes. Trackers cost nothing until one is
+        # created, and each write is then a range appended to a list.
+        tracker = WriteTracker()
+        Memory.trackers.append(tracker)
+        return tracker
+
+    @staticmethod
+    def untrack_writes(tracker: WriteTracker):
+        if tracker in Memory.trackers:
+            Memory.trackers.remove(tracker)
+
+    @staticmethod
+    def mark_written(start: int, end: int):
+        for tracker in Memory.trackers:
+            tracker.mark(start, end)
 
     def set_location(self, start_address: int):
         Memory.start_address = start_address
@@ -77,6 +138,29 @@ class Memory(BusClient):
     def write(address: int, data: int):
         # during a cpu write cycle the ram accepts data from the data bus
         Memory.mem[address] = (data & Memory.bit_mask)
+        if Memory.trackers:
+            Memory.mark_written(address, address + 1)
+
+    def holds(self, start_address: int, count: int) -> bool:
+        # True if the block lies within this memory
+        end = start_address + count
+        return Memory.start_address <= start_address and end <= min(Memory.end_address, len(Memory.mem))
+
+    def write_block(self, start_address: int, words) -> int:
+        """ Copy a block of words into memory with one slice
+        assignment, bypassing the bus. Used by the loader. Returns
+        the number of words written.
+        """
+        if self.read_only:
+            raise ValueError('Can not load into read only memory')
+        if not self.holds(start_address, len(words)):
+            msg = f'Block 0x{start_address:04x} - 0x{start_address + len(words) - 1:04x} is outside RAM'
+            raise ValueError(msg)
+        if Memory.bit_mask < 0xFFFF:
+            words = [word & Memory.bit_mask for word in words]
+        Memory.mem[start_address:start_address + len(words)] = words
+        Memory.mark_written(start_address, start_address + len(words))
+        return len(words)
 
     def dump(self, start_addr: int, end_addr: int) -> str:
         rep = 'Memory Dump:\n'
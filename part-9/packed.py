@@ -0,0 +1,121 @@
+#!/usr/bin/python3
+# -*- coding: utf-8 -*-
+# File: packed.py
+""" Tiny-T Packed Binary Image Format
+Tiny-T is a simple CPU Simulator intended as a teaching aid for students
+learning about computer architecture.
+This program is free software: you can redistribute it and/or modify it under
+the terms of the GNU General Public License as published by the Free Software
+Foundation, either version 2 of the License, or (at your option) any later
+version.
+This program is distributed in the hope that it will be useful, but WITHOUT
+ANY WARRANTY; without even the implied warranty of MERCHANTABILITY or FITNESS
+FOR A PARTICULAR PURPOSE. See the GNU General Public License for more details.
+You should have received a copy of the GNU General Public License along with
+this program. If not, see <http://www.gnu.org/licenses/>.
+"""
+
+__author__ = "Randall Morgan"
+__contact__ = "rmorgan@coderancher.us"
+__copyright__ = "Copyright 2022, SensorNet"
+__credits__ = ["Randall Morgan", "SensorNet.Us"]
+__date__ = "2022/05/23"
+__deprecated__ = False
+__email__ = "rmorgan@coderancher.us"
+__license__ = "GPLv2 or Later"
+__maintainer__ = "Randall Morgan"
+__status__ = "Production"
+__version__ = "1.0.0"
+
+# Packed Image Layout (all values little endian)
+# Offset | Size     | Description
+# -----------------------------------------------------
+# 0      | 4        | Magic b'TTBI'
+# 4      | 2        | Format version
+# 6      | 2        | Segment count (n)
+# 8      | 4 * n    | Segment table: start address, length in words
+# 8 + 4n | 2 * sum  | Payload: the words of each segment in table order
+#
+# The text .bin format remains the teaching format. The packed
+# format is for large images: a loader reads the payload as raw
+# uint16 words with no per-word parsing.
+
+import struct
+import sys
+from array import array
+
+MAGIC = b'TTBI'
+VERSION = 1
+EXTENSION = '.tbin'
+
+HEADER = struct.Struct('<4sHH')
+SEGMENT = struct.Struct('<HH')
+
+
+def segments(words) -> list[tuple[int, array]]:
+    # Group (address, word) pairs into runs of consecutive
+    # addresses. When an address is written twice the last
+    # word wins, as it would when loading the text format.
+    image = dict(words)
+    runs = []
+    start = None
+    run = None
+    for address in sorted(image):
+        if run is None or address != start + len(run):
+            start = address
+            run = array('H')
+            runs.append((start, run))
+        run.append(image[address])
+    return runs
+
+
+def pack(words) -> bytes:
+    runs = segments(words)
+    parts = [HEADER.pack(MAGIC, VERSION, len(runs))]
+    parts.extend(SEGMENT.pack(start, len(run)) for start, run in runs)
+    for start, run in runs:
+        if sys.byteorder != 'little':
+            run.byteswap()
+        parts.append(run.tobytes())
+    return b''.join(parts)
+
+
+def is_packed(data) -> bool:
+    return bytes(data[:len(MAGIC)]) == MAGIC
+
+
+def unpack(data) -> list[tuple[int, memoryview]]:
+    """ Return the (start address, words) segments of a packed
+    image. On little endian hosts the words are memoryviews into
+    data itself, so nothing is copied.
+    """
+    view = memoryview(data)
+    if len(view) < HEADER.size:
+        raise ValueError('Truncated packed image header')
+
+    magic, version, count = HEADER.unpack_from(view)
+    if magic != MAGIC:
+        raise ValueError(f'Not a packed Tiny-T image. Magic: {magic}')
+    if version != VERSION:
+        raise ValueError(f'Unsupported packed image version {version}')
+
+    table = HEADER.size
+    offset = table + count * SEGMENT.size
+    if offset > len(view):
+        raise ValueError('Truncated packed image segment table')
+
+    runs = []
+    for start, length in SEGMENT.iter_unpack(view[table:offset]):
+        end = offset + 2 * length
+        if end > len(view):
+            raise ValueError(f'Truncated segment at address {start}')
+        if sys.byteorder == 'little':
+            run = view[offset:end].cast('H')
+        else:
+            run = array('H')
+            run.frombytes(view[offset:end])
+            run.byteswap()
+            run = memoryview(run)
+        runs.append((start, run))
+        offset = end
+    return runs
@@ -0,0 +1,350 @@
+#!/usr/bin/python3
+# -*- coding: utf-8 -*-
+# File: peephole.py
+""" Tiny-T Peephole Optimizer
+Tiny-T is a simple CPU Simulator intended as a teaching aid for students
+learning about computer architecture.
+This program is free software: you can redistribute it and/or modify it under
+the terms of the GNU General Public License as published by the Free Software
+Foundation, either version 2 of the License, or (at your option) any later
+version.
+This program is distributed in the hope that it will be useful, but WITHOUT
+ANY WARRANTY; without even the implied warranty of MERCHANTABILITY or FITNESS
+FOR A PARTICULAR PURPOSE. See the GNU General Public License for more details.
+You should have received a copy of the GNU General Public License along with
+this program. If not, see <http://www.gnu.org/licenses/>.
+"""
+
+__author__ = "Randall Morgan"
+__contact__ = "rmorgan@coderancher.us"
+__copyright__ = "Copyright 2022, SensorNet"
+__credits__ = ["Randall Morgan", "SensorNet.Us"]
+__date__ = "2022/05/23"
+__deprecated__ = False
+__email__ = "rmorgan@coderancher.us"
+__license__ = "GPLv2 or Later"
+__maintainer__ = "Randall Morgan"
+__status__ = "Production"
+__version__ = "1.0.0"
+
+# The optimizer runs on the parsed statements, after parsing and
+# before the assembler lays out addresses and fixes up symbols.
+#
+# Rewrite               | Condition
+# -----------------------------------------------------
+# STA x / LDA x         | drop the LDA when the flags it would
+#                       | set are the ones already held, or are
+#                       | overwritten before they are tested
+# NOT / NOT             | drop both when the flags are overwritten
+#                       | before they are tested
+# BRx next              | drop a branch to the following word
+# BRx a ... a: BRA b    | branch straight to b (jump threading)
+# BRA/HTL then code     | drop unlabelled code that can not be
+#                       | reached
+#
+# Removing a word moves everything after it, so the optimizer
+# never removes or rewrites a word that may be used as data:
+# words carrying a label that is loaded, stored or named by data,
+# words at an address written as a literal operand, and words
+# inside the span of a label expression such as table+3. A word is
+# also kept when removing it would move a literal address.
+
+import bisect
+import copy
+
+from assembler import Expression, Statement
+
+HLT, LDA, STA, NOT, SHR, BRA, BRP, BRZ = 0x0, 0x1, 0x2, 0x8, 0xA, 0xB, 0xC, 0xD
+
+# Instructions whose operand is a memory address
+MEMORY_ACCESS = {0x1, 0x2, 0x3, 0x4, 0x5, 0x6, 0x7}
+BRANCHES = {BRA, BRP, BRZ}
+
+# Instructions that set the Z and P flags, and the subset that
+# always leaves them matching the accumulator. ADD, SUB, NOT and
+# SHR (which shifts left) test the flags on the unmasked result,
+# so after an overflow the flags and the accumulator disagree.
+FLAG_SETTERS = {0x1, 0x3, 0x4, 0x5, 0x6, 0x7, 0x8, 0x9, 0xA, 0xE}
+CLEAN_FLAGS = {0x1, 0x5, 0x6, 0x7, 0x9, 0xE}
+FLAG_READERS = {BRP, BRZ}
+
+# How far ahead to look for the next flag test
+FLAG_WINDOW = 16
+MAX_PASSES = 16
+
+
+class PeepholeOptimizer:
+    def __init__(self):
+        self.counts = {
+            'sta_lda': 0,
+            'double_not': 0,
+            'branch_next': 0,
+            'threaded': 0,
+            'unreachable': 0,
+        }
+        self.words_before = 0
+        self.words_after = 0
+
+    def optimize(self, statements: list[Statement]) -> list[Statement]:
+        """ Returns a new list of the same length. Removed
+        instructions become empty statements that keep their
+        labels, so labels move to the next word.
+        """
+        statements = list(statements)
+        self.words_before = sum(statement.size for statement in statements)
+        for _ in range(MAX_PASSES):
+            try:
+                self.layout(statements)
+            except (ValueError, KeyError):
+                # Leave errors for the assembler to report
+                break
+            if not self.run_pass(statements):
+                break
+        self.words_after = sum(statement.size for statement in statements)
+        return statements
+
+    def report(self) -> str:
+        saved = self.words_before - self.words_after
+        lines = [f'Peephole: {self.words_before} words -> {self.words_after} words ({saved} saved)']
+        descriptions = {
+            'sta_lda': 'LDA after STA removed',
+            'double_not': 'NOT NOT words removed',
+            'branch_next': 'branches to next removed',
+            'threaded': 'branches threaded',
+            'unreachable': 'unreachable words removed',
+        }
+        for key, description in descriptions.items():
+            lines.append(f'  {description}: {self.counts[key]}')
+        return '\n'.join(lines)
+
+    # Analysis
+
+    def value(self, operand):
+        # Value of an operand, or None if it names an import
+        if isinstance(operand, int):
+            return operand
+        elif isinstance(operand, str):
+            return self.symbols.get(operand)
+        elif all(name in self.symbols for name in operand.symbols()):
+            return operand.evaluate(self.symbols)
+        return None
+
+    def layout(self, statements: list[Statement]):
+        # Addresses and symbols as the assembler will see them, the
+        # placed words (items), which items can be entered other
+        # than by falling through, and the ORG. segment of each item.
+        self.symbols = {}
+        self.constants = set()
+        self.addresses = []
+        self.items = []
+        self.entry = []
+        self.segment = []
+        self.segment_ends = []
+        address = 0
+        entry = True
+        for index, statement in enumerate(statements):
+            if statement.value is not None:
+                value = statement.value
+                if not isinstance(value, int):
+                    value = Expression([(1, value)] if isinstance(value, str) else value.terms)
+                    value = value.evaluate(self.symbols)
+                for label in statement.labels:
+                    self.symbols[label] = value
+                    self.constants.add(label)
+            else:
+                for label in statement.labels:
+                    self.symbols[label] = address
+                entry = entry or bool(statement.labels)
+
+            if statement.origin is not None:
+                self.segment_ends.append(address)
+                address = statement.origin
+                entry = True
+
+            self.addresses.append(address)
+            if statement.size:
+                self.items.append(index)
+                self.entry.append(entry)
+                self.segment.append(len(self.segment_ends))
+                entry = False
+            address += statement.size
+        self.segment_ends.append(address)
+        self.find_pinned(statements)
+
+    def find_pinned(self, statements: list[Statement]):
+        literals = set()
+        spans = []
+        data_labels = set()
+        for statement in statements:
+            if statement.data is not None:
+                operands = statement.data
+            elif statement.opcode is not None:
+                operands = [statement.operand]
+            else:
+                continue
+
+            for operand in operands:
+                if isinstance(operand, int):
+                    if statement.opcode in MEMORY_ACCESS or statement.opcode in BRANCHES:
+                        literals.add(operand)
+                    continue
+
+                names = [operand] if isinstance(operand, str) else operand.symbols()
+                if statement.opcode not in BRANCHES:
+                    data_labels.update(names)
+                if isinstance(operand, Expression):
+                    points = [self.symbols[name] for name in names
+                              if name in self.symbols and name not in self.constants]
+                    value = self.value(operand)
+                    if points and value is not None:
+                        points.append(value)
+                        spans.append((min(points), max(points)))
+
+        self.literals = sorted(literals)
+        self.spans = spans
+        self.pinned = set()
+        for item, index in enumerate(self.items):
+            statement = statements[index]
+            address = self.addresses[index]
+            if (any(label in data_labels for label in self.labels_of(statements, item))
+                    or self.literals_in(address, address + statement.size)
+                    or any(low <= address <= high for low, high in spans)):
+                self.pinned.add(item)
+
+    def labels_of(self, statements: list[Statement], item: int) -> list[str]:
+        # Labels naming the item's address, including those on
+        # empty lines above it.
+        index = self.items[item]
+        first = self.items[item - 1] + 1 if item else 0
+        labels = []
+        for statement in statements[first:index + 1]:
+            if statement.value is None:
+                labels.extend(statement.labels)
+        return labels
+
+    def literals_in(self, low: int, high: int) -> list[int]:
+        start = bisect.bisect_left(self.literals, low)
+        end = bisect.bisect_left(self.literals, high)
+        return self.literals[start:end]
+
+    def can_remove(self, item: int) -> bool:
+        # Removing the item moves every later word in its segment
+        if item in self.pinned:
+            return False
+        address = self.addresses[self.items[item]]
+        end = self.segment_ends[self.segment[item]]
+        if self.literals_in(address, max(end, address + 1)):
+            return False
+        return not any(low <= address < high for low, high in self.spans)
+
+    def flags_dead(self, statements: list[Statement], item: int) -> bool:
+        # True when the flags are set again before anything tests
+        # them on the fall through path starting at item.
+        for ahead in range(item, min(item + FLAG_WINDOW, len(self.items))):
+            statement = statements[self.items[ahead]]
+            if ahead > item and self.segment[ahead] != self.segment[ahead - 1]:
+                return False
+            if statement.data is not None or statement.opcode in FLAG_READERS or statement.opcode == BRA:
+                return False
+            if statement.opcode in FLAG_SETTERS or statement.opcode == HLT:
+                return True
+        return False
+
+    # Rewrites
+
+    @staticmethod
+    def blank(statement: Statement) -> Statement:
+        removed = copy.copy(statement)
+        removed.opcode = None
+        removed.operand = 0
+        removed.data = None
+        return removed
+
+    def remove(self, statements: list[Statement], item: int, rule: str):
+        index = self.items[item]
+        statements[index] = self.blank(statements[index])
+        self.counts[rule] += 1
+
+    def is_local(self, operand) -> bool:
+        return isinstance(operand, str) and operand in self.symbols and operand not in self.constants
+
+    def run_pass(self, statements: list[Statement]) -> bool:
+        changed = False
+        targets = {self.addresses[index]: item for item, index in enumerate(self.items)}
+        item = 0
+        while item < len(self.items):
+            current = statements[self.items[item]]
+            following = statements[self.items[item + 1]] if item + 1 < len(self.items) else None
+            adjacent = (following is not None and not self.entry[item + 1]
+                        and self.segment[item] == self.segment[item + 1])
+            step = 1
+
+            if (adjacent and current.opcode == STA and following.opcode == LDA
+                    and self.is_local(current.operand) and following.operand == current.operand
+                    and item not in self.pinned and self.can_remove(item + 1)
+                    and (self.flags_clean(statements, item) or self.flags_dead(statements, item + 2))):
+                self.remove(statements, item + 1, 'sta_lda')
+                step = 2
+
+            elif (adjacent and current.opcode == NOT and following.opcode == NOT
+                    and self.can_remove(item) and self.can_remove(item + 1)
+                    and self.flags_dead(statements, item + 2)):
+                self.remove(statements, item, 'double_not')
+                self.remove(statements, item + 1, 'double_not')
+                step = 2
+
+            elif current.opcode in BRANCHES and self.is_local(current.operand) and item not in self.pinned:
+                address = self.addresses[self.items[item]]
+                target = self.symbols[current.operand]
+                if target == address + 1 and self.can_remove(item):
+                    self.remove(statements, item, 'branch_next')
+                    step = 2
+                else:
+                    operand = self.thread(statements, targets, current.operand)
+                    if operand != current.operand:
+                        threaded = copy.copy(current)
+                        threaded.operand = operand
+                        statements[self.items[item]] = threaded
+                        self.counts['threaded'] += 1
+
+            if statements[self.items[item]].opcode in (BRA, HLT) and statements[self.items[item]].size:
+                step = max(step, self.remove_unreachable(statements, item))
+
+            if step > 1 or statements[self.items[item]] is not current:
+                changed = True
+            item += step
+        return changed
+
+    def flags_clean(self, statements: list[Statement], item: int) -> bool:
+        # The word before item is the only way in, and it left the
+        # flags matching the accumulator.
+        if item == 0 or self.entry[item] or self.segment[item - 1] != self.segment[item]:
+            return False
+        return statements[self.items[item - 1]].opcode in CLEAN_FLAGS
+
+    def thread(self, statements: list[Statement], targets: dict, operand: str) -> str:
+        seen = {operand}
+        while True:
+            item = targets.get(self.symbols[operand])
+            if item is None or item in self.pinned:
+                return operand
+            statement = statements[self.items[item]]
+            if statement.opcode != BRA or not self.is_local(statement.operand):
+                return operand
+            if statement.operand in seen:
+                return operand
+            operand = statement.operand
+            seen.add(operand)
+
+    def remove_unreachable(self, statements: list[Statement], item: int) -> int:
+        # Unlabelled code after BRA or HTL can only run by falling
+        # through from above, which never happens. Data is kept.
+        ahead = item + 1
+        while ahead < len(self.items) and not self.entry[ahead]:
+            statement = statements[self.items[ahead]]
+            if (statement.data is not None or self.segment[ahead] != self.segment[item]
+                    or not self.can_remove(ahead)):
+                break
+            self.remove(statements, ahead, 'unreachable')
+            ahead += 1
+        return ahead - item
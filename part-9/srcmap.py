@@ -0,0 +1,148 @@
+#!/usr/bin/python3
+# -*- coding: utf-8 -*-
+# File: srcmap.py
+""" Tiny-T Source Map
+Tiny-T is a simple CPU Simulator intended as a teaching aid for students
+learning about computer architecture.
+This program is free software: you can redistribute it and/or modify it under
+the terms of the GNU General Public License as published by the Free Software
+Foundation, either version 2 of the License, or (at your option) any later
+version.
+This program is distributed in the hope that it will be useful, but WITHOUT
+ANY WARRANTY; without even the implied warranty of MERCHANTABILITY or FITNESS
+FOR A PARTICULAR PURPOSE. See the GNU General Public License for more details.
+You should have received a copy of the GNU General Public License along with
+this program. If not, see <http://www.gnu.org/licenses/>.
+"""
+
+__author__ = "Randall Morgan"
+__contact__ = "rmorgan@coderancher.us"
+__copyright__ = "Copyright 2022, SensorNet"
+__credits__ = ["Randall Morgan", "SensorNet.Us"]
+__date__ = "2022/05/23"
+__deprecated__ = False
+__email__ = "rmorgan@coderancher.us"
+__license__ = "GPLv2 or Later"
+__maintainer__ = "Randall Morgan"
+__status__ = "Production"
+__version__ = "1.0.0"
+
+# A source map records where each word of an image came from and
+# the assembler's symbol table, so that tools working with a
+# running image can show source lines and labels instead of bare
+# addresses. It is written next to the image by assembler.py -l
+# as JSON text:
+#
+#   {"format": "tiny-t-map", "version": 1,
+#    "files": ["echo.asm"],
+#    "symbols": {"start": 0, "size": 4},
+#    "constants": ["size"],
+#    "lines": [[address, words, file index, line number], ...]}
+#
+# Each entry of "lines" is a run of consecutive words placed by
+# one source line, sorted by address. Looking up an address is a
+# binary search.
+
+import bisect
+import json
+
+
+class SourceMap:
+    FORMAT = 'tiny-t-map'
+    VERSION = 1
+    EXTENSION = '.map'
+
+    def __init__(self):
+        self.files = []
+        self.symbols = {}
+        self.constants = set()
+        self.lines = []
+        self.starts = []
+        self._labels = None
+
+    @staticmethod
+    def from_assembler(asm, words=None):
+        # Build the map from an assembler that has run parse()
+        if words is None:
+            words = asm.words()
+        source_map = SourceMap()
+        files = {}
+        placed = {}
+        for (addr, word), index in zip(words, asm.code_lines):
+            filename, number = asm.origin(index)
+            # When a line overwrites an earlier one the last
+            # word wins, as it does when the image is loaded.
+            placed[addr] = (files.setdefault(filename, len(files)), number)
+
+        runs = []
+        for addr in sorted(placed):
+            file_index, number = placed[addr]
+            if runs and runs[-1][0] + runs[-1][1] == addr and runs[-1][2:] == [file_index, number]:
+                runs[-1][1] += 1
+            else:
+                runs.append([addr, 1, file_index, number])
+
+        source_map.files = list(files)
+        source_map.symbols = dict(asm.symbol_table)
+        source_map.constants = set(asm.constants)
+        source_map.set_lines(runs)
+        return source_map
+
+    def set_lines(self, runs: list):
+        self.lines = sorted(list(run) for run in runs)
+        self.starts = [run[0] for run in self.lines]
+
+    def line_at(self, address: int):
+        """ Return (file, line number) of the source line that
+        placed the word at address, or None.
+        """
+        index = bisect.bisect_right(self.starts, address) - 1
+        if index < 0:
+            return None
+        start, length, file_index, number = self.lines[index]
+        if address >= start + length:
+            return None
+        return self.files[file_index], number
+
+    def labels(self) -> dict:
+        # Address -> label, ignoring EQU. constants
+        if self._labels is None:
+            self._labels = {}
+            for name, value in sorted(self.symbols.items()):
+                if name not in self.constants:
+                    self._labels.setdefault(value, name)
+        return self._labels
+
+    def label_at(self, address: int):
+        return self.labels().get(address)
+
+    def to_json(self) -> str:
+        return json.dumps({
+            'format': self.FORMAT,
+            'version': self.VERSION,
+            'files': self.files,
+            'symbols': self.symbols,
+            'constants': sorted(self.constants),
+            'lines': self.lines,
+        }, separators=(',', ':'))
+
+    @staticmethod
+    def from_json(text: str):
+        data = json.loads(text)
+        if data.get('format') != SourceMap.FORMAT or data.get('version') != SourceMap.VERSION:
+            raise ValueError('Not a Tiny-T source map')
+        source_map = SourceMap()
+        source_map.files = data['files']
+        source_map.symbols = data['symbols']
+        source_map.constants = set(data['constants'])
+        source_map.set_lines(data['lines'])
+        return source_map
+
+    def save(self, path: str):
+        with open(path, 'w') as ofh:
+            ofh.write(self.to_json())
+
+    @staticmethod
+    def load(path: str):
+        with open(path, 'r') as ifh:
+            return SourceMap.from_json(ifh.read())
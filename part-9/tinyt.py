@@ -0,0 +1,95 @@
+#!/usr/bin/python3
+# -*- coding: utf-8 -*-
+# File: tinyt.py
+""" Tiny-T Command Line
+Tiny-T is a simple CPU Simulator intended as a teaching aid for students
+learning about computer architecture.
+This program is free software: you can redistribute it and/or modify it under
+the terms of the GNU General Public License as published by the Free Software
+Foundation, either version 2 of the License, or (at your option) any later
+version.
+This program is distributed in the hope that it will be useful, but WITHOUT
+ANY WARRANTY; without even the implied warranty of MERCHANTABILITY or FITNESS
+FOR A PARTICULAR PURPOSE. See the GNU General Public License for more details.
+You should have received a copy of the GNU General Public License along with
+this program. If not, see <http://www.gnu.org/licenses/>.
+"""
+
+__author__ = "Randall Morgan"
+__contact__ = "rmorgan@coderancher.us"
+__copyright__ = "Copyright 2022, SensorNet"
+__credits__ = ["Randall Morgan", "SensorNet.Us"]
+__date__ = "2022/05/23"
+__deprecated__ = False
+__email__ = "rmorgan@coderancher.us"
+__license__ = "GPLv2 or Later"
+__maintainer__ = "Randall Morgan"
+__status__ = "Production"
+__version__ = "1.0.0"
+
+# One command for the Tiny-T tools:
+#
+#   tinyt asm -i echo.asm -o echo.bin
+#   tinyt disasm -r -i echo.bin -o echo.asm_
+#   tinyt run -i echo.bin
+#   tinyt batch -d build asm/*.asm
+#
+# The options after the command are those of the tool it runs
+# (assembler.py, disassembler.py, loader.py, batch.py, linker.py,
+# translate.py, bench.py). A tool's module is imported only when
+# its command runs, so "tinyt run" does not load the assembler and
+# start up stays quick as more tools are added.
+#
+# The tools import each other by module name, so this directory is
+# put on the module path first. tinyt.py can then be run, or linked
+# to as "tinyt", from any directory.
+
+import importlib
+import os
+import sys
+
+HERE = os.path.dirname(os.path.realpath(__file__))
+
+# Command -> (module, description)
+COMMANDS = {
+    'asm': ('assembler', 'Assemble a source file'),
+    'disasm': ('disassembler', 'Disassemble an image'),
+    'run': ('loader', 'Load an image and run it'),
+    'batch': ('batch', 'Assemble many sources in parallel'),
+    'link': ('linker', 'Link object modules'),
+    'translate': ('translate', 'Translate a Tiny-P image to Tiny-T'),
+    'bench': ('bench', 'Run the benchmark suite'),
+}
+
+
+def usage() -> str:
+    lines = ['Usage: tinyt <command> [options]', '', 'Commands:']
+    for command, (module, description) in COMMANDS.items():
+        lines.append(f'  {command:<10} {description} ({module}.py)')
+    lines.append('')
+    lines.append('Run "tinyt <command> -h" for the options of a command.')
+    return '\n'.join(lines)
+
+
+def main(argv):
+    if not argv or argv[0] in ('-h', '--help'):
+        print(usage())
+        sys.exit()
+    if argv[0] in ('-V', '--version'):
+        print(f'tinyt {__version__}')
+        sys.exit()
+
+    command = COMMANDS.get(argv[0])
+    if command is None:
+        print(f'tinyt: unknown command {argv[0]}')
+        print(usage())
+        sys.exit(2)
+
+    if HERE not in sys.path:
+        sys.path.insert(0, HERE)
+    module = importlib.import_module(command[0])
+    module.main(argv[1:])
+
+
+if __name__ == '__main__':
+    main(sys.argv[1:])
@@ -0,0 +1,125 @@
+#!/usr/bin/python3
+# -*- coding: utf-8 -*-
+# File: tokenizer.py
+""" Tiny-T Assembly Language Tokenizer
+Tiny-T is a simple CPU Simulator intended as a teaching aid for students
+learning about computer architecture.
+This program is free software: you can redistribute it and/or modify it under
+the terms of the GNU General Public License as published by the Free Software
+Foundation, either version 2 of the License, or (at your option) any later
+version.
+This program is distributed in the hope that it will be useful, but WITHOUT
+ANY WARRANTY; without even the implied warranty of MERCHANTABILITY or FITNESS
+FOR A PARTICULAR PURPOSE. See the GNU General Public License for more details.
+You should have received a copy of the GNU General Public License along with
+this program. If not, see <http://www.gnu.org/licenses/>.
+"""
+
+__author__ = "Randall Morgan"
+__contact__ = "rmorgan@coderancher.us"
+__copyright__ = "Copyright 2022, SensorNet"
+__credits__ = ["Randall Morgan", "SensorNet.Us"]
+__date__ = "2022/05/23"
+__deprecated__ = False
+__email__ = "rmorgan@coderancher.us"
+__license__ = "GPLv2 or Later"
+__maintainer__ = "Randall Morgan"
+__status__ = "Production"
+__version__ = "1.0.0"
+
+# The tokenizer splits a line of assembly source into typed
+# tokens with a single compiled regular expression, so each line
+# is scanned once by the regex engine.
+#
+# Kind       | Example          | Notes
+# -----------------------------------------------------
+# label      | loop:            |
+# directive  | ORG.             |
+# mnemonic   | LDA              | Only names in the opcode table
+# number     | 42, 0x2A         |
+# identifier | loop             | Symbol names
+# string     | "Hi\n"           | Case is kept
+# operator   | + - ,            |
+# comment    | # note           | Runs to the end of the line
+# error      | 12ab, ?          | Anything else
+#
+# Token text is lower case, except for strings and comments.
+# Columns count from 1. A comment needs no space before it, so
+# LDA x#note is LDA x followed by a comment.
+
+import re
+from collections import namedtuple
+
+Token = namedtuple('Token', ['kind', 'text', 'column'])
+
+LABEL = 'label'
+DIRECTIVE = 'directive'
+MNEMONIC = 'mnemonic'
+NUMBER = 'number'
+IDENTIFIER = 'identifier'
+STRING = 'string'
+OPERATOR = 'operator'
+COMMENT = 'comment'
+ERROR = 'error'
+
+# Each match takes the white space before a token with it, so the
+# scan never stops between tokens.
+PATTERN = r'''\s*(?:
+      (?P<comment>\#.*)
+    | (?P<string>"(?:[^"\\]|\\.)*")
+    | (?P<label>[a-z_]\w*:)
+    | (?P<directive>[a-z_]\w*\.)
+    | (?P<number>(?:0x[0-9a-f]+|[0-9]+)(?![\w.:]))
+    {mnemonics}
+    | (?P<identifier>[a-z_]\w*)
+    | (?P<operator>[-+,])
+    | (?P<error>[^\s#,]+))
+'''
+
+# Compiled patterns, one per set of mnemonics
+PATTERNS = {}
+
+NUMBER_TEXT = re.compile(r'(?:0x[0-9a-f]+|[0-9]+)\Z', re.IGNORECASE)
+
+
+def is_number(text: str) -> bool:
+    return NUMBER_TEXT.match(text) is not None
+
+
+def number_value(text: str) -> int:
+    # Value of the text of a number token
+    if text[:2].lower() == '0x':
+        return int(text[2:], 16)
+    return int(text)
+
+
+def compile_pattern(mnemonics: frozenset):
+    # The mnemonics are part of the pattern, so telling them
+    # from identifiers needs no work per token.
+    pattern = PATTERNS.get(mnemonics)
+    if pattern is None:
+        names = '|'.join(sorted((re.escape(name.lower()) for name in mnemonics), key=len, reverse=True))
+        alternative = rf'| (?P<mnemonic>(?:{names})(?![\w.:]))' if names else ''
+        pattern = re.compile(PATTERN.format(mnemonics=alternative), re.VERBOSE)
+        PATTERNS[mnemonics] = pattern
+    return pattern
+
+
+class Tokenizer:
+    def __init__(self, mnemonics=()):
+        self.mnemonics = frozenset(mnemonics)
+        self.pattern = compile_pattern(self.mnemonics)
+
+    def tokens(self, line: str) -> list[Token]:
+        # The line is lower cased once and scanned once. Strings
+        # and a trailing comment are then copied from the line
+        # itself to keep their case.
+        tokens = [Token(kind, match.group(kind), match.start(kind) + 1)
+                  for match in self.pattern.finditer(line.lower()) for kind in (match.lastgroup,)]
+        if '"' in line:
+            tokens = [Token(STRING, line[tok.column - 1:tok.column - 1 + len(tok.text)], tok.column)
+                      if tok.kind == STRING else tok for tok in tokens]
+        if tokens and tokens[-1].kind == COMMENT:
+            column = tokens[-1].column
+            tokens[-1] = Token(COMMENT, line[column - 1:], column)
+        return tokens
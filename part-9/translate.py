@@ -0,0 +1,223 @@
+#!/usr/bin/python3
+# -*- coding: utf-8 -*-
+# File: translate.py
+""" Tiny-P to Tiny-T Translator
+Tiny-T is a simple CPU Simulator intended as a teaching aid for students
+learning about computer architecture.
+This program is free software: you can redistribute it and/or modify it under
+the terms of the GNU General Public License as published by the Free Software
+Foundation, either version 2 of the License, or (at your option) any later
+version.
+This program is distributed in the hope that it will be useful, but WITHOUT
+ANY WARRANTY; without even the implied warranty of MERCHANTABILITY or FITNESS
+FOR A PARTICULAR PURPOSE. See the GNU General Public License for more details.
+You should have received a copy of the GNU General Public License along with
+this program. If not, see <http://www.gnu.org/licenses/>.
+"""
+
+__author__ = "Randall Morgan"
+__contact__ = "rmorgan@coderancher.us"
+__copyright__ = "Copyright 2022, SensorNet"
+__credits__ = ["Randall Morgan", "SensorNet.Us"]
+__date__ = "2022/05/23"
+__deprecated__ = False
+__email__ = "rmorgan@coderancher.us"
+__license__ = "GPLv2 or Later"
+__maintainer__ = "Randall Morgan"
+__status__ = "Production"
+__version__ = "1.0.0"
+
+# The translator rewrites a Tiny-P program (parts 3 to 6) as a
+# Tiny-T image, so Tiny-P programs run on the Tiny-T CPU.
+#
+# Tiny-T Address | Contents
+# -----------------------------------------------------
+# 0x000          | Reset shim: LDA zero, BRA to Tiny-P address 0
+# 0x100 -        | Translated ROM, then BRA back to Tiny-P address 0
+# 0xF00 - 0xF63  | Tiny-P RAM, one word per cell
+# 0xF64          | Constant 0
+# 0xF65          | Scratch word for the flag shims
+#
+# Code starts at 0x100 to stay clear of the console, which
+# answers at 0x0FE and 0x0FF.
+#
+# Tiny-P | Tiny-T
+# -----------------------------------------------------
+# NOP    | nothing, its address names the next instruction
+# LDA x  | LDA ram+x
+# STA x  | STA ram+x
+# AND x  | AND ram+x
+# OR  x  | OR  ram+x
+# NOT    | NOT, STA scratch, LDA scratch
+# ADD x  | ADD ram+x, STA scratch, LDA scratch
+# SUB x  | SUB ram+x
+# BRZ a  | BRZ code address of a
+# BRP a  | BRP code address of a
+#
+# Tiny-T sets Z and P on the result before it is cut to 16 bits.
+# After ADD wraps to 0x10000, or NOT of 0xFFFF, Z would be clear
+# on a zero accumulator, so those results are stored and loaded
+# back to set the flags from the 16 bit value. Tiny-P starts with
+# Z and P set, which the reset shim's LDA of the constant 0
+# reproduces. The Tiny-P program counter wraps from 99 to 0, which
+# the BRA after the last word reproduces.
+#
+# The Tiny-P accumulator is unbounded, Tiny-T's is 16 bits, so
+# results must stay within -32768 to 32767 to match.
+
+import getopt
+import sys
+
+import packed
+from assembler import to_text
+from isa import TINY_P, TINY_T
+
+LDA, STA, ADD, SUB, AND, OR, NOT, BRA, BRP, BRZ = 0x1, 0x2, 0x3, 0x4, 0x5, 0x6, 0x8, 0xB, 0xC, 0xD
+
+# Tiny-P opcode -> Tiny-T opcode
+OPCODES = {1: LDA, 2: STA, 3: AND, 4: OR, 5: NOT, 6: ADD, 7: SUB, 8: BRZ, 9: BRP}
+NOP = 0
+BRANCHES = {8, 9}
+# Tiny-P opcodes that need the flag shim
+SHIMMED = {5, 6}
+
+CODE_BASE = 0x100
+RAM_BASE = 0xF00
+ZERO = RAM_BASE + TINY_P.address_space
+SCRATCH = ZERO + 1
+
+
+class Translator:
+    def __init__(self, program, memory=None):
+        """ program is the Tiny-P ROM as (address, word) pairs and
+        memory the starting RAM as (address, value) pairs.
+        """
+        self.rom = [0] * TINY_P.address_space
+        for address, word in program:
+            self.rom[self.check_address(address)] = self.check_word(word)
+        self.ram = [0] * TINY_P.address_space
+        for address, value in memory or ():
+            if not -0x8000 <= value <= 0xFFFF:
+                raise ValueError(f'RAM value out of range for 16 bits: {value}')
+            self.ram[self.check_address(address)] = value & 0xFFFF
+        # Tiny-P address -> Tiny-T address of its translation
+        self.address_map = {}
+        self.wrap = CODE_BASE
+
+    @staticmethod
+    def check_address(address: int) -> int:
+        if not 0 <= address < TINY_P.address_space:
+            raise ValueError(f'Tiny-P address out of range: {address}')
+        return address
+
+    @staticmethod
+    def check_word(word: int) -> int:
+        if not TINY_P.word_min <= word <= TINY_P.word_max:
+            raise ValueError(f'Illegal Tiny-P instruction: {word}')
+        return word
+
+    @staticmethod
+    def size(opcode: int) -> int:
+        if opcode == NOP:
+            return 0
+        return 3 if opcode in SHIMMED else 1
+
+    def layout(self):
+        address = CODE_BASE
+        for p_address, word in enumerate(self.rom):
+            self.address_map[p_address] = address
+            address += self.size(TINY_P.decode(word)[0])
+        # NOPs at the end of ROM name the wrap around branch
+        self.wrap = address
+
+    def translate(self) -> list[tuple[int, int]]:
+        # Returns the Tiny-T image as (address, word) pairs
+        self.layout()
+        start = self.address_map[0]
+        words = [
+            (0x000, TINY_T.encode(LDA, ZERO)),
+            (0x001, TINY_T.encode(BRA, start)),
+        ]
+
+        address = CODE_BASE
+        for word in self.rom:
+            opcode, operand = TINY_P.decode(word)
+            if opcode == NOP:
+                continue
+            if opcode in BRANCHES:
+                target = self.address_map[operand]
+            elif opcode == 5:
+                target = 0
+            else:
+                target = RAM_BASE + operand
+            words.append((address, TINY_T.encode(OPCODES[opcode], target)))
+            address += 1
+            if opcode in SHIMMED:
+                words.append((address, TINY_T.encode(STA, SCRATCH)))
+                words.append((address + 1, TINY_T.encode(LDA, SCRATCH)))
+                address += 2
+        words.append((self.wrap, TINY_T.encode(BRA, start)))
+
+        words.extend((RAM_BASE + cell, value) for cell, value in enumerate(self.ram))
+        words.append((ZERO, 0))
+        words.append((SCRATCH, 0))
+        return words
+
+
+def read_pairs(path: str) -> list[tuple[int, int]]:
+    # (address, value) pairs from the text .bin format
+    pairs = []
+    with open(path, 'r') as ifh:
+        for line in ifh:
+            fields = line.split()
+            if len(fields) == 2:
+                pairs.append((int(fields[0]), int(fields[1])))
+    return pairs
+
+
+def main(argv):
+    inputfile = ''
+    outputfile = ''
+    datafile = ''
+    binary = False
+    usage_message = "Usage: translate.py [-b] [-d <ramfile>] -i <tiny-p.bin> -o <tiny-t.bin>"
+
+    try:
+        opts, args = getopt.getopt(argv, "hbd:i:o:", ["help", "binary", "data=", "ifile=", "ofile="])
+    except getopt.GetoptError:
+        print(usage_message)
+        sys.exit(2)
+
+    for opt, arg in opts:
+        if opt in ('-h', '--help'):
+            print(usage_message)
+            sys.exit()
+        elif opt in ('-i', '--ifile'):
+            inputfile = arg
+        elif opt in ('-o', '--ofile'):
+            outputfile = arg
+        elif opt in ('-d', '--data'):
+            datafile = arg
+        elif opt in ('-b', '--binary'):
+            binary = True
+
+    if not inputfile or not outputfile:
+        print(usage_message)
+        sys.exit(2)
+
+    memory = read_pairs(datafile) if datafile else None
+    translator = Translator(read_pairs(inputfile), memory)
+    words = translator.translate()
+
+    if binary:
+        with open(outputfile, 'wb') as ofh:
+            ofh.write(packed.pack(words))
+    else:
+        with open(outputfile, 'w') as ofh:
+            ofh.write(to_text(words))
+
+    print(f"Translated: {inputfile} and wrote Tiny-T machine code to {outputfile}")
+
+
+if __name__ == '__main__':
+    main(sys.argv[1:])